@@ -1,330 +1,232 @@
 import streamlit as st
-import openai
 import os
 import json
-import base64
-from PIL import Image, ImageDraw, ImageFont
-from ebooklib import epub
-import io
-import zipfile
 import hashlib
+import threading
+
+from toth.artifacts import book_key, get_artifact_cache
+from toth.assets import HEADER_LOGO_PATH, HEADER_LOGO_WIDTH, STYLE_THUMB_WIDTH, get_asset_registry
+from toth.drive import file_exists, upload_file
+from toth.epub import DEFAULT_EPUB_PROFILE, EPUB_PROFILES
+from toth.jobs import DONE, FAILED, get_job_manager
+from toth.order import PageOrder
+from toth.pipeline import DEFAULT_NUMBER_MODE, NUMBER_MODES, OUTPUTS, STAGES, generate_book_cached
+from toth.pixels import ingest_in_background
+from toth.preview import render_previews
+from toth.print_profiles import DEFAULT_PRINT_DPI, DEFAULT_PRINT_PROFILE, PRINT_DPIS, PRINT_PROFILES
+from toth.store import get_upload_store
+from toth.thumbnails import get_thumbnail
+from toth.tracing import Trace
 
 # ------------------ Integração com Google Drive ------------------
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
-
-# Caminho da logo
-LOGO_PATH = "Terra_Cultural_sem_fundo.png"
-
-def upload_to_drive(file_bytes, filename, folder_id=None):
-    SCOPES = ['https://www.googleapis.com/auth/drive']
+def upload_to_drive(source, filename, folder_id=None, artifact_key=None):
     service_account_json = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON") or st.secrets.get("GOOGLE_SERVICE_ACCOUNT_JSON")
     if service_account_json is None:
         st.error("A variável de ambiente (ou secret) GOOGLE_SERVICE_ACCOUNT_JSON não está definida!")
         return None
 
-    service_account_info = json.loads(service_account_json)
-    credentials = service_account.Credentials.from_service_account_info(service_account_info, scopes=SCOPES)
-    service = build('drive', 'v3', credentials=credentials)
-    
-    file_metadata = {
-        'name': filename,
-        'mimeType': 'application/zip'
-    }
-    if folder_id:
-        file_metadata['parents'] = [folder_id]
-    
-    media = MediaIoBaseUpload(io.BytesIO(file_bytes), mimetype='application/zip')
-    file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-    return file.get('id')
-
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
-def get_base64_image(image_path):
-    if os.path.exists(image_path):
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode()
-    else:
-        return ""
-
-def int_to_roman(num):
-    val = [1000, 900, 500, 400,
-           100, 90, 50, 40,
-           10, 9, 5, 4,
-           1]
-    syms = ["M", "CM", "D", "CD",
-            "C", "XC", "L", "XL",
-            "X", "IX", "V", "IV",
-            "I"]
-    roman_num = ''
-    i = 0
-    while num > 0:
-        for _ in range(num // val[i]):
-            roman_num += syms[i]
-            num -= val[i]
-        i += 1
-    return roman_num
-
-def add_page_number(image, display_number, alignment, style="Padrão", custom_color=None):
-    img = image.copy()
-    draw = ImageDraw.Draw(img)
-    
-    # Utiliza uma altura padrão (ex.: altura de exportação do PDF com sangria)
-    default_height = 2775  # pixels
-    font_size = int(default_height / 45)  # ajuste esse divisor conforme necessário
-
-    # Seleciona a fonte conforme o estilo
-    if style == "Romano":
-        font_path = os.path.join("fonts", "EBGaramond-Regular.ttf")
-    elif style == "Fresco":
-        font_path = os.path.join("fonts", "Pacifico-Regular.ttf")
-    elif style == "Moderno":
-        font_path = os.path.join("fonts", "Montserrat-Regular.ttf")
-    elif style == "Elegante":
-        font_path = os.path.join("fonts", "CormorantGaramond-Regular.ttf")
-    elif style == "Desenhado":
-        font_path = os.path.join("fonts", "ButterflyKids-Regular.ttf")
-    else:
-        font_path = os.path.join("fonts", "Roboto-Regular.ttf")
-    
+    # O mesmo livro (mesmas páginas e configuração) já enviado a esta pasta não é enviado de novo
+    cache = get_artifact_cache()
+    if artifact_key:
+        file_id = cache.drive_file_id(artifact_key, folder_id)
+        try:
+            if file_id and file_exists(file_id, service_account_json=service_account_json):
+                st.info("Este livro já estava no Google Drive; o arquivo existente foi reaproveitado.")
+                return file_id
+        except Exception:
+            pass  # Na dúvida, envia de novo
+
+    progress_bar = st.progress(0.0, text="Enviando para o Google Drive...")
+    trace = Trace("upload", file=filename)
+
+    # O cliente é reaproveitado entre envios e o arquivo vai em partes, com retomada em caso de falha
     try:
-        font = ImageFont.truetype(font_path, font_size)
-    except IOError:
-        font = ImageFont.load_default()
-
-    text = int_to_roman(display_number) if style == "Romano" else str(display_number)
-
-    # Define cores e contornos (outline) conforme o estilo
-    if style in ["Padrão", "Romano"]:
-        fill_color = custom_color if custom_color else "#FFFFFF"
-        outline_range = 1
-        do_outline = True
-    elif style == "Fresco":
-        fill_color = custom_color if custom_color else "#FFD700"
-        outline_range = 2
-        do_outline = True
-    elif style == "Moderno":
-        fill_color = custom_color if custom_color else "#007BFF"
-        outline_range = 0
-        do_outline = False
-    elif style == "Elegante":
-        fill_color = custom_color if custom_color else "#8E44AD"
-        outline_range = 1
-        do_outline = True
-    elif style == "Desenhado":
-        fill_color = custom_color if custom_color else "#FF69B4"
-        outline_range = 1
-        do_outline = True
-    else:
-        fill_color = custom_color if custom_color else "#FFFFFF"
-        outline_range = 1
-        do_outline = True
-
-    # Posicionamento com base na largura real da imagem
-    width, height = img.size
-    bbox = draw.textbbox((0, 0), text, font=font)
-    text_width = bbox[2] - bbox[0]
-    text_height = bbox[3] - bbox[1]
-
-    margin = int(2 / 2.54 * 96)  # 2 cm em pixels
-
-    if alignment == "Esquerda":
-        x = margin
-    elif alignment == "Direita":
-        x = width - text_width - margin
-    else:
-        available_width = width - 2 * margin
-        x = margin + (available_width - text_width) / 2
-
-    y = height - text_height - margin
-
-    if do_outline and outline_range > 0:
-        for dx in range(-outline_range, outline_range + 1):
-            for dy in range(-outline_range, outline_range + 1):
-                draw.text((x + dx, y + dy), text, font=font, fill="black")
-    draw.text((x, y), text, font=font, fill=fill_color)
-    return img
-
-def add_logo_bottom_center(image, logo_path=LOGO_PATH, margin_bottom_cm=1.0, max_logo_width=200):
-    if not os.path.exists(logo_path):
-        return image 
-    img = image.copy()
-    logo = Image.open(logo_path)
-
-    ratio = max_logo_width / logo.width
-    new_w = int(logo.width * ratio * 0.5)
-    new_h = int(logo.height * ratio * 0.5)
-    logo = logo.resize((new_w, new_h), Image.LANCZOS)
-
-    if logo.mode != "RGBA":
-        logo = logo.convert("RGBA")
-
-    margin_px = int(margin_bottom_cm / 2.54 * 96)
-    x = (img.width - new_w) // 2
-    y = img.height - margin_px - new_h
-
-    if img.mode == "RGBA":
-        img.alpha_composite(logo, (x, y))
-    else:
-        img.paste(logo, (x, y), logo)
-    return img
-
-def generate_pdf(images):
-    pdf_bytes = io.BytesIO()
-    if images:
-        images[0].save(pdf_bytes, format="PDF", save_all=True, append_images=images[1:])
-    pdf_bytes.seek(0)
-    return pdf_bytes
-
-def scale_and_crop_to_fill(img, target_w, target_h):
-    w, h = img.size
-    ratio_img = w / h
-    ratio_target = target_w / target_h
-
-    if ratio_img > ratio_target:
-        new_height = target_h
-        scale = new_height / h
-        new_width = int(w * scale)
-        resized = img.resize((new_width, new_height), resample=Image.LANCZOS)
-        left = (new_width - target_w) // 2
-        final_img = resized.crop((left, 0, left + target_w, new_height))
-    else:
-        new_width = target_w
-        scale = new_width / w
-        new_height = int(h * scale)
-        resized = img.resize((new_width, new_height), resample=Image.LANCZOS)
-        top = (new_height - target_h) // 2
-        final_img = resized.crop((0, top, new_width, top + target_h))
-    return final_img
-
-def generate_pdf_sangria(images, dpi=300):
-    width_inch = 6.125
-    height_inch = 9.25
-    target_w = int(round(width_inch * dpi))   # ~1838 px
-    target_h = int(round(height_inch * dpi))    # ~2775 px
-
-    pdf_pages = []
-    for img in images:
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-        filled_img = scale_and_crop_to_fill(img, target_w, target_h)
-        pdf_pages.append(filled_img)
-
-    pdf_bytes = io.BytesIO()
-    if pdf_pages:
-        pdf_pages[0].save(pdf_bytes, format="PDF", resolution=dpi, save_all=True, append_images=pdf_pages[1:])
-    pdf_bytes.seek(0)
-    return pdf_bytes
-
-def generate_epub(files, start_page, end_page, initial_number, alignment, number_style, custom_color=None, add_numbering=True):
-    book = epub.EpubBook()
-    book.set_identifier("id_livro_123")
-    book.set_title("Livro Ilustrado")
-    book.set_language("pt")
-    book.add_author("Globaltec")
-    
-    html_colors = {
-        "Padrão": custom_color if custom_color else "#FFFFFF",
-        "Romano": custom_color if custom_color else "#FFFFFF",
-        "Fresco": custom_color if custom_color else "#FFD700",
-        "Moderno": custom_color if custom_color else "#007BFF",
-        "Elegante": custom_color if custom_color else "#8E44AD"
-    }
-    
-    chapters = []
-    for idx, f_dict in enumerate(files):
-        page_position = idx + 1
-        image_data = f_dict["data"]
-        image_filename = f"image_{idx}.jpg"
-    
-        epub_img = epub.EpubItem(
-            uid=image_filename,
-            file_name=image_filename,
-            media_type="image/jpeg",
-            content=image_data
-        )
-        book.add_item(epub_img)
-    
-        if add_numbering and start_page <= page_position <= end_page:
-            display_number = initial_number + (page_position - start_page)
-            display_text = int_to_roman(display_number) if number_style == "Romano" else str(display_number)
-            html_color = html_colors.get(number_style, "#FFFFFF")
-            if alignment == "Esquerda":
-                align_style = "text-align:left; margin-left:75px;"
-            elif alignment == "Direita":
-                align_style = "text-align:right; margin-right:75px;"
-            else:
-                align_style = "text-align:center; margin:0 75px;"
-            number_html = f"<div style='{align_style} font-size:16px; margin-top:10px; color:{html_color};'>{display_text}</div>"
-        else:
-            number_html = ""
-    
-        c = epub.EpubHtml(
-            title=f"Página {page_position}",
-            file_name=f"page_{idx}.xhtml",
-            lang="pt"
-        )
-        c.content = f"""
-        <html>
-          <head>
-            <meta charset="utf-8" />
-            <title>Página {page_position}</title>
-          </head>
-          <body>
-            <h1>Página {page_position}</h1>
-            <img src="{image_filename}" alt="Página {page_position}" style="width:100%;"/>
-            {number_html}
-          </body>
-        </html>
-        """
-        book.add_item(c)
-        chapters.append(c)
-    
-    book.toc = tuple(chapters)
-    book.add_item(epub.EpubNcx())
-    book.add_item(epub.EpubNav())
-    book.spine = ["nav"] + chapters
-    
-    epub_bytes = io.BytesIO()
-    epub.write_epub(epub_bytes, book)
-    epub_bytes.seek(0)
-    return epub_bytes
-
-def move_page(file_index, new_position):
+        with trace.span("drive_upload", bytes_in=os.path.getsize(source)) as stats:
+            def on_progress(sent, total):
+                stats.bytes_out = sent
+                fraction = sent / total if total else 1.0
+                progress_bar.progress(fraction, text=f"Enviando para o Google Drive... {fraction:.0%}")
+
+            file_id = upload_file(source, filename, folder_id=folder_id, service_account_json=service_account_json, progress=on_progress)
+    except Exception as exc:
+        st.session_state.upload_trace = trace.finish("failed")
+        st.error(f"Erro no envio ao Google Drive: {exc}")
+        return None
+    st.session_state.upload_trace = trace.finish("ok")
+    if artifact_key:
+        cache.record_upload(artifact_key, folder_id, file_id)
+    return file_id
+
+def get_base64_image(image_path, max_width):
+    # Reduzido e codificado uma vez por processo (ou quando o arquivo muda), não a cada rerun
+    return get_asset_registry().thumbnail_base64(image_path, max_width)
+
+@st.cache_resource
+def preload_assets():
+    # Uma vez por processo, em segundo plano para não atrasar a primeira página:
+    # logos, fontes e miniaturas dos estilos ficam prontos para todas as sessões
+    registry = get_asset_registry()
+    threading.Thread(target=registry.preload, name="toth-assets", daemon=True).start()
+    return registry
+
+# Aplica todas as alterações de ordem de uma vez e recarrega a página uma única vez.
+# Os ids das páginas são estáveis, então excluir uma página não renumera as demais.
+def apply_order_changes(operations=(), targets=None, permutation=None):
     order = st.session_state.order
-    current_pos = order.index(file_index)
-    order.pop(current_pos)
-    new_index = max(0, min(new_position - 1, len(order)))
-    order.insert(new_index, file_index)
-    st.session_state.order = order
+    deleted = order.apply(operations)
+    if targets:
+        order.place(targets)
+    if permutation is not None:
+        order.permute(permutation)
+
+    for page_id in deleted:
+        del st.session_state.file_data[page_id]
+        st.session_state.pop(f"select_{page_id}", None)
+    if deleted:
+        st.session_state.upload_key += 1
+    # Os campos de posição voltam a refletir a nova ordem
+    for page_id in order:
+        st.session_state.pop(f"pos_{page_id}", None)
     st.rerun()
 
+def move_page(page_id, new_position):
+    apply_order_changes([("move", page_id, new_position)])
+
 # Atualização da remoção: a ordenação é ajustada sem reinicializar para preservar a configuração
-def remove_page(file_index):
-    st.session_state.file_data.pop(file_index)
-    new_order = []
-    for idx in st.session_state.order:
-        if idx < file_index:
-            new_order.append(idx)
-        elif idx > file_index:
-            new_order.append(idx - 1)
-    st.session_state.order = new_order
-    st.session_state.upload_key += 1
-    st.rerun()
+def remove_page(page_id):
+    apply_order_changes([("delete", page_id)])
+
+# Cancela o job de geração da sessão (se houver) e o desvincula da sessão e da URL
+def cancel_generation_job():
+    job_id = st.session_state.pop("job_id", None)
+    if job_id:
+        job = get_job_manager().get(job_id)
+        if job is not None:
+            job.cancel()
+    st.query_params.pop("job", None)
+
+@st.fragment(run_every=1)
+def generation_progress(job_id):
+    job = get_job_manager().get(job_id)
+    if job is None or job.finished:
+        # Recarrega a página inteira para exibir o resultado
+        st.rerun()
+    st.info("Gerando o livro em segundo plano. Você pode continuar usando a página.")
+    outputs = job.meta.get("outputs", list(OUTPUTS))
+    for stage, label in STAGES:
+        if stage in OUTPUTS and stage not in outputs:
+            continue
+        done, total = job.stages.get(stage, (0, 0))
+        st.progress(done / total if total else 0.0, text=f"{label}: {done}/{total}")
+    if st.button("Cancelar geração", key=f"cancel_{job_id}"):
+        job.cancel()
+
+def adopt_book(result):
+    st.session_state.zip_path = result["zip_path"]
+    st.session_state.zip_filename = result["zip_filename"]
+    st.session_state.generation_trace = result.get("trace")
+    st.session_state.artifact_key = result.get("cache_key")
+    st.session_state.book_generated = True
+
+def release_download():
+    # Depois do clique o botão some e o Streamlit descarta a cópia do ZIP em memória
+    st.session_state.pop("download_ready", None)
+
+def show_book_download():
+    # O ZIP fica em disco, mas o st.download_button lê o arquivo inteiro para a memória do
+    # servidor a cada rerun em que aparece. Por isso ele só é carregado quando o usuário pede
+    zip_path = st.session_state.zip_path
+    if not os.path.exists(zip_path):
+        st.warning("O arquivo gerado expirou. Clique em Gerar Livro novamente.")
+        return
+    if st.session_state.get("download_ready") != zip_path:
+        size_mb = os.path.getsize(zip_path) / (1024 * 1024)
+        if st.button(f"Preparar download ({size_mb:.1f} MB)"):
+            st.session_state.download_ready = zip_path
+            st.rerun()
+        return
+    with open(zip_path, "rb") as zip_file:
+        st.download_button("Baixar ZIP", data=zip_file, file_name=st.session_state.zip_filename,
+                           mime="application/zip", on_click=release_download)
+
+def show_generation_job(job_id):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        # Job expirado ou de outro processo do servidor
+        st.session_state.pop("job_id", None)
+        st.query_params.pop("job", None)
+        return
+    st.session_state.job_id = job_id
+
+    if not job.finished:
+        generation_progress(job_id)
+    elif job.status == DONE:
+        if st.session_state.get("adopted_job") != job_id:
+            st.session_state.adopted_job = job_id
+            adopt_book(job.result)
+        if job.result.get("cached"):
+            st.success("Livro recuperado: ele já tinha sido gerado com as mesmas páginas e configuração.")
+        else:
+            st.success("Livro gerado com sucesso!")
+        show_book_download()
+    elif job.status == FAILED:
+        st.error(f"Falha ao gerar o livro: {job.error}")
+    else:
+        st.warning("Geração cancelada.")
+
+def show_diagnostics():
+    # Medições da última geração e do último envio ao Drive desta sessão
+    traces = [t for t in (st.session_state.get("generation_trace"), st.session_state.get("upload_trace")) if t]
+    if not traces:
+        return
+    titles = {"generation": "Geração do livro", "upload": "Envio ao Google Drive"}
+    with st.expander("🩺 Diagnóstico"):
+        for trace in traces:
+            st.markdown(f"**{titles.get(trace['name'], trace['name'])}** — {trace['duration_s']:.2f} s ({trace['status']})")
+            st.dataframe(
+                [
+                    {
+                        "Etapa": stage["stage"],
+                        "Execuções": stage["calls"],
+                        "Tempo (s)": stage["duration_s"],
+                        "Entrada (MB)": round(stage["bytes_in"] / (1024 * 1024), 2),
+                        "Saída (MB)": round(stage["bytes_out"] / (1024 * 1024), 2),
+                        "Pico de memória (MB)": stage["peak_rss_mb"],
+                    }
+                    for stage in trace["stages"]
+                ],
+                hide_index=True
+            )
+        st.caption("Os passos pages.* somam o tempo de todos os workers de renderização.")
+
+def show_preview(files, config):
+    # Prévia reduzida da página escolhida e, com a logo, da capa e da última página
+    num_pages = len(files)
+    position = st.number_input("Página a pré-visualizar (posição)", min_value=1, max_value=num_pages,
+                               value=min(2, num_pages), key="preview_position")
+    positions = [position]
+    if config["include_logo"]:
+        positions += [p for p in dict.fromkeys((1, num_pages)) if p != position]
+    captions = {num_pages: "Última página", 1: "Capa"}
+    cols = st.columns(3)
+    for col, p, preview in zip(cols, positions, render_previews(files, positions, config)):
+        col.image(preview, caption=captions.get(p, f"Página {p}"), use_container_width=True)
 
 def chunk_list(seq, chunk_size=7):
     for i in range(0, len(seq), chunk_size):
         yield seq[i:i + chunk_size]
 
 def book_page():
+    # Arquivos alterados no disco desde a última leitura são recarregados
+    preload_assets().refresh()
+
     if "book_generated" not in st.session_state:
         st.session_state.book_generated = False
-    if "zip_data" in st.session_state and not st.session_state.book_generated:
-        del st.session_state.zip_data
+    if "zip_path" in st.session_state and not st.session_state.book_generated:
+        del st.session_state.zip_path
         del st.session_state.zip_filename
 
-    logo_base64 = get_base64_image("logo.png")
+    logo_base64 = get_base64_image(HEADER_LOGO_PATH, HEADER_LOGO_WIDTH)
     if logo_base64:
         st.markdown(f"""
             <div style="text-align:center;">
@@ -346,14 +248,18 @@ def book_page():
     """)
 
     # Inicializa file_data, order e upload_key se ainda não estiverem definidas
+    # (file_data é indexado pelo id estável de cada página, atribuído por order)
     if 'file_data' not in st.session_state:
-        st.session_state.file_data = []
+        st.session_state.file_data = {}
     if 'order' not in st.session_state:
-        st.session_state.order = list(range(len(st.session_state.file_data)))
+        st.session_state.order = PageOrder(st.session_state.file_data)
     if 'upload_key' not in st.session_state:
         st.session_state.upload_key = 0
+    if 'seen_uploads' not in st.session_state:
+        st.session_state.seen_uploads = set()
 
-    # Ao fazer o upload, armazenamos também os dados originais para não acumular as modificações
+    # Ao fazer o upload, as imagens originais vão para o spool em disco (endereçado pelo SHA-256)
+    # e a sessão guarda apenas referências, para não acumular as modificações nem ocupar memória
     uploaded_files = st.file_uploader(
         "Escolha as imagens",
         type=["png", "jpg", "jpeg"],
@@ -361,16 +267,24 @@ def book_page():
         key=f"upload_{st.session_state.upload_key}"
     )
     if uploaded_files:
-        existing_names = [f["name"] for f in st.session_state.file_data]
+        store = get_upload_store()
         for f in uploaded_files:
-            if f.name not in existing_names:
-                bytes_data = f.read()
-                st.session_state.file_data.append({
-                    "name": f.name,
-                    "original_data": bytes_data,   # Armazena a imagem original
-                    "data": bytes_data             # Inicialmente, data é idêntica à original
-                })
-                st.session_state.order.append(len(st.session_state.file_data) - 1)
+            # O uploader devolve todos os arquivos a cada rerun; cada envio só é processado uma vez
+            if f.file_id in st.session_state.seen_uploads:
+                continue
+            st.session_state.seen_uploads.add(f.file_id)
+            f.seek(0)
+            sha256, path = store.put(f)
+            page_id = st.session_state.order.add()
+            st.session_state.file_data[page_id] = {
+                "name": f.name,
+                "sha256": sha256,  # Chave do spool e do cache de páginas renderizadas
+                "path": path,      # Imagem original, imutável, no spool em disco
+                "thumb": get_thumbnail(sha256, path)  # Miniatura usada na grade
+            }
+            # Decodifica e normaliza a página em segundo plano, antes de "Gerar Livro"
+            ingest_in_background(sha256, path)
+        store.prune()
 
     st.markdown("""
     <style>
@@ -416,25 +330,41 @@ def book_page():
     if st.session_state.file_data:
         order = st.session_state.order
         st.write("### Reordene as páginas (7 por linha)")
-        for row_chunk in chunk_list(order, 7):
+        st.caption("Altere várias posições ou marque várias páginas e aplique tudo de uma vez.")
+        batch_cols = st.columns(4)
+        if batch_cols[0].button("✔ Aplicar posições", key="batch_move"):
+            targets = {}
+            for page_id in order:
+                new_pos = st.session_state.get(f"pos_{page_id}")
+                if new_pos is not None and new_pos != order.position(page_id):
+                    targets[page_id] = new_pos
+            apply_order_changes(targets=targets)
+        if batch_cols[1].button("🗑  Excluir selecionadas", key="batch_delete"):
+            apply_order_changes([("delete", page_id) for page_id in order if st.session_state.get(f"select_{page_id}")])
+        if batch_cols[2].button("🔤 Ordenar por nome", key="batch_sort"):
+            apply_order_changes(permutation=sorted(order, key=lambda page_id: st.session_state.file_data[page_id]["name"]))
+        if batch_cols[3].button("🔁 Inverter ordem", key="batch_reverse"):
+            apply_order_changes(permutation=reversed(order.ids))
+
+        for row_chunk in chunk_list(order.ids, 7):
             cols = st.columns(len(row_chunk))
             st.markdown(
                 "<hr style='border: none; border-top: 1px dashed #bbb; margin: 20px 0;'>",
                 unsafe_allow_html=True
             )
             for idx, col in enumerate(cols):
-                file_index = row_chunk[idx]
-                f_dict = st.session_state.file_data[file_index]
+                page_id = row_chunk[idx]
+                f_dict = st.session_state.file_data[page_id]
                 
-                if col.button("🗑  Excluir", key=f"delete_{file_index}"):
-                    remove_page(file_index)
+                if col.button("🗑  Excluir", key=f"delete_{page_id}"):
+                    remove_page(page_id)
                 
-                image = Image.open(io.BytesIO(f_dict["data"]))
-                col.image(image, use_container_width=True)
-                current_position = order.index(file_index) + 1
-                new_pos = col.number_input("Posição", min_value=1, max_value=len(order), value=current_position, key=f"pos_{file_index}")
-                if col.button("↔ Mover", key=f"update_{file_index}"):
-                    move_page(file_index, new_pos)
+                col.image(f_dict["thumb"], use_container_width=True)
+                col.checkbox("Selecionar", key=f"select_{page_id}")
+                current_position = order.position(page_id)
+                new_pos = col.number_input("Posição", min_value=1, max_value=len(order), value=current_position, key=f"pos_{page_id}")
+                if col.button("↔ Mover", key=f"update_{page_id}"):
+                    move_page(page_id, new_pos)
     
         st.write("### Defina o título do Livro")
         book_name = st.text_input("Digite o nome do livro:", value="MeuLivro")
@@ -479,7 +409,7 @@ def book_page():
             chunk = styles[chunk_start:chunk_start + n_cols]
             for i, style in enumerate(chunk):
                 with cols[i]:
-                    st.image(style_thumbnails[style], width=70)
+                    st.image(get_asset_registry().thumbnail(style_thumbnails[style], STYLE_THUMB_WIDTH), width=70)
                     if st.button(style, key=f"style_{style}"):
                         st.session_state.selected_style = style
         
@@ -487,10 +417,43 @@ def book_page():
         
         custom_color = st.color_picker("Escolha a cor para a numeração", value="#FFFFFF")
         alignment = st.selectbox("Alinhamento da numeração", ["Esquerda", "Central", "Direita"], index=1)
+        number_modes = list(NUMBER_MODES)
+        number_mode = st.selectbox(
+            "Numeração nos PDFs",
+            number_modes,
+            index=number_modes.index(DEFAULT_NUMBER_MODE),
+            format_func=lambda mode: NUMBER_MODES[mode],
+            help="Vetorial: o número é escrito como texto sobre a página original, sem recomprimir a imagem."
+        )
     
         include_epub_numbering = st.checkbox("Incluir numeração no EPUB", value=True)
+        epub_profiles = list(EPUB_PROFILES)
+        epub_profile = st.selectbox(
+            "Otimização das imagens do EPUB",
+            epub_profiles,
+            index=epub_profiles.index(DEFAULT_EPUB_PROFILE),
+            format_func=lambda profile: EPUB_PROFILES[profile]["label"]
+        )
         include_logo = st.checkbox("Incluir logo da editora na capa e última página", value=True)
 
+        print_profiles = list(PRINT_PROFILES)
+        print_profile = st.selectbox(
+            "Formato de impressão (PDF com sangria)",
+            print_profiles,
+            index=print_profiles.index(DEFAULT_PRINT_PROFILE),
+            format_func=lambda profile: PRINT_PROFILES[profile]["label"]
+        )
+        print_dpi = st.selectbox("Resolução do PDF com sangria (dpi)", PRINT_DPIS, index=PRINT_DPIS.index(DEFAULT_PRINT_DPI))
+        outputs = st.multiselect(
+            "Arquivos do livro",
+            list(OUTPUTS),
+            default=list(OUTPUTS),
+            format_func=lambda output: OUTPUTS[output],
+            help="Gere só o que for usar, por exemplo apenas o PDF com sangria para a gráfica."
+        )
+        if not outputs:
+            st.error("Escolha ao menos um arquivo para gerar.")
+
         # Validação da configuração para forçar nova geração se alterado
         config = {
             "book_name": book_name,
@@ -500,84 +463,62 @@ def book_page():
             "number_style": number_style,
             "custom_color": custom_color,
             "alignment": alignment,
+            "number_mode": number_mode,
             "include_epub_numbering": include_epub_numbering,
-            "include_logo": include_logo
+            "epub_profile": epub_profile,
+            "include_logo": include_logo,
+            "print_profile": print_profile,
+            "print_dpi": print_dpi,
+            "outputs": outputs
         }
+
+        st.write("### Pré-visualização")
+        show_preview([st.session_state.file_data[i] for i in order], config)
+
         new_config_hash = hashlib.md5(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
         if st.session_state.get("config_hash") != new_config_hash:
+            # Um livro gerado (ou em geração) com a configuração anterior deixa de valer
+            if st.session_state.get("config_hash") is not None:
+                cancel_generation_job()
             st.session_state.config_hash = new_config_hash
             st.session_state.book_generated = False
 
-        if st.button("Gerar Livro"):
-            new_order = st.session_state.order
-            # Cria uma cópia dos arquivos sem modificar os dados originais
-            reordered_files = [dict(st.session_state.file_data[i]) for i in new_order]
-            
-            image_list = []
-            for pos, file_index in enumerate(new_order, start=1):
-                f_dict = st.session_state.file_data[file_index]
-                # Sempre utiliza os dados originais para não acumular numerações
-                img = Image.open(io.BytesIO(f_dict["original_data"]))
-                
-                if img.mode != "RGB":
-                    img = img.convert("RGB")
-                
-                if num_start <= pos <= num_end:
-                    display_number = initial_number + (pos - num_start)
-                    img = add_page_number(img, display_number, alignment, style=number_style, custom_color=custom_color)
-                
-                if include_logo and (pos == 1 or pos == len(new_order)):
-                    img = add_logo_bottom_center(img, logo_path=LOGO_PATH, margin_bottom_cm=1.0, max_logo_width=200)
-                
-                with io.BytesIO() as output:
-                    img.save(output, format="JPEG")
-                    # Atualiza os arquivos da cópia temporária somente para geração atual
-                    reordered_files[pos - 1]["data"] = output.getvalue()
-                
-                image_list.append(img)
-            
-            pdf_bytes = generate_pdf(image_list)
-            sangria_pdf_bytes = generate_pdf_sangria(image_list, dpi=300)
-            epub_bytes = generate_epub(
-                reordered_files,
-                num_start,
-                num_end,
-                initial_number,
-                alignment,
-                number_style,
-                custom_color=custom_color,
-                add_numbering=include_epub_numbering
-            )
-            
-            pdf_filename = f"{book_name}.pdf"
-            sangria_pdf_filename = f"{book_name}_sangria.pdf"
-            epub_filename = "livro.epub"
-            zip_filename = f"{book_name}.zip"
-            
-            zip_bytes = io.BytesIO()
-            with zipfile.ZipFile(zip_bytes, mode="w") as zipf:
-                zipf.writestr(pdf_filename, pdf_bytes.getvalue())
-                zipf.writestr(sangria_pdf_filename, sangria_pdf_bytes.getvalue())
-                zipf.writestr(epub_filename, epub_bytes.getvalue())
-            zip_bytes.seek(0)
-            
-            st.session_state.zip_data = zip_bytes.getvalue()
-            st.session_state.zip_filename = zip_filename
-            st.session_state.book_generated = True
-            
-            st.success("Livro gerado com sucesso!")
-            st.download_button("Baixar ZIP", data=zip_bytes, file_name=zip_filename, mime="application/zip")
-    
+        if st.button("Gerar Livro", disabled=not outputs):
+            # A geração roda em segundo plano; a sessão só guarda o id do job
+            files = [st.session_state.file_data[i] for i in st.session_state.order]
+            cancel_generation_job()
+            artifact_key = book_key(files, config)
+            cached = get_artifact_cache().get(artifact_key)
+            if cached is not None:
+                # Mesmo livro já gerado (nesta ou em outra sessão): nada a gerar
+                adopt_book({**cached, "cache_key": artifact_key})
+            else:
+                job = get_job_manager().submit(generate_book_cached, files, config,
+                                               meta={"config_hash": new_config_hash, "outputs": outputs})
+                st.session_state.job_id = job.id
+                st.query_params["job"] = job.id
+
+    # O id do job também fica na URL para recuperar o livro após recarregar a página
+    job_id = st.session_state.get("job_id") or st.query_params.get("job")
+    if job_id:
+        show_generation_job(job_id)
+    elif st.session_state.get("book_generated", False):
+        st.success("Livro recuperado: ele já tinha sido gerado com as mesmas páginas e configuração.")
+        show_book_download()
+
     if st.session_state.get("book_generated", False):
         if st.button("Enviar para o Google Drive"):
             folder_id = "1aOIGtkAVjfh5qfxWidgbR-yLp0C4ZzjG"
-            file_id = upload_to_drive(st.session_state.zip_data, st.session_state.zip_filename, folder_id=folder_id)
+            file_id = upload_to_drive(st.session_state.zip_path, st.session_state.zip_filename, folder_id=folder_id,
+                                      artifact_key=st.session_state.get("artifact_key"))
             if file_id:
                 drive_link = f"https://drive.google.com/file/d/{file_id}/view"
-                st.success(f"Arquivo enviado com sucesso! Nome do arquivo: {book_name}")
+                st.success(f"Arquivo enviado com sucesso! Nome do arquivo: {os.path.splitext(st.session_state.zip_filename)[0]}")
                 st.markdown(f"✅ [Clique aqui para acessar o arquivo no Google Drive]({drive_link})")
             else:
                 st.error("Falha ao enviar para o Google Drive.")
 
+    show_diagnostics()
+
 if __name__ == "__main__":
     book_page()
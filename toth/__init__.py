@@ -0,0 +1 @@
+"""Pipeline de geração de livros do Projeto Toth, independente da interface Streamlit."""
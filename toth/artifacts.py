@@ -0,0 +1,149 @@
+"""Cache em disco dos livros gerados, compartilhado entre sessões.
+
+A chave é o hash do conteúdo das páginas, na ordem, mais a configuração do livro
+(os mesmos campos do config_hash da interface) e o conteúdo da fonte e da logo, então
+trocar um desses arquivos no disco gera o livro de novo. Dois editores gerando o mesmo livro,
+ou uma aba recarregada, recebem o ZIP já pronto. Cada entrada guarda também o id do
+arquivo enviado ao Drive em cada pasta, para que o mesmo ZIP não seja enviado duas
+vezes.
+
+O cache é limitado pelo tamanho total dos ZIPs (descartando os menos usados) e por
+um prazo sem uso.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+ARTIFACT_CACHE_DIR = os.getenv("TOTH_ARTIFACT_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "toth_artifact_cache")
+ARTIFACT_CACHE_MB = int(os.getenv("TOTH_ARTIFACT_CACHE_MB", "4096"))
+# Livros não usados (gerados, baixados ou enviados) há mais tempo que isso são removidos
+ARTIFACT_CACHE_TTL_HOURS = float(os.getenv("TOTH_ARTIFACT_CACHE_TTL_HOURS", "72"))
+
+
+def book_key(files, config):
+    """Hash do conteúdo das páginas, na ordem, mais a configuração do livro e a fonte e a logo usadas."""
+    from toth.imaging import asset_version
+
+    assets = asset_version(config.get("number_style"), config.get("include_logo", False))
+    payload = {"pages": [f["sha256"] for f in files], "config": config, "assets": assets}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ArtifactCache:
+    def __init__(self, root=ARTIFACT_CACHE_DIR, max_bytes=ARTIFACT_CACHE_MB * 1024 * 1024,
+                 ttl_hours=ARTIFACT_CACHE_TTL_HOURS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_hours = ttl_hours
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _zip_path(self, key):
+        return os.path.join(self.root, f"{key}.zip")
+
+    def _info_path(self, key):
+        return os.path.join(self.root, f"{key}.json")
+
+    def _read_info(self, key):
+        with open(self._info_path(key), encoding="utf-8") as fh:
+            return json.load(fh)
+
+    def _write_info(self, key, info):
+        # Escrita atômica: outra sessão nunca lê um JSON pela metade
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".info-")
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(info, fh, ensure_ascii=False)
+        os.replace(tmp_path, self._info_path(key))
+
+    def get(self, key):
+        """Devolve {"zip_path", "zip_filename", "trace", "drive"} ou None; renova o prazo da entrada."""
+        zip_path = self._zip_path(key)
+        try:
+            info = self._read_info(key)
+            # O mtime do ZIP marca o último uso (ordem do LRU e prazo)
+            os.utime(zip_path)
+        except (OSError, ValueError):
+            return None
+        return {"zip_path": zip_path, "zip_filename": info["zip_filename"],
+                "trace": info.get("trace"), "drive": info.get("drive", {})}
+
+    def put(self, key, zip_path, zip_filename, trace=None):
+        """Move o ZIP gerado para o cache e devolve a entrada (no formato de get)."""
+        if os.path.getsize(zip_path) > self.max_bytes:
+            # Não caberia no cache: fica onde está, sem entrada
+            return {"zip_path": zip_path, "zip_filename": zip_filename, "trace": trace, "drive": {}}
+        with self._lock:
+            tmp_path = os.path.join(self.root, f".{key}.zip.part")
+            shutil.move(zip_path, tmp_path)
+            os.replace(tmp_path, self._zip_path(key))
+            self._write_info(key, {"zip_filename": zip_filename, "created_at": time.time(),
+                                   "trace": trace, "drive": {}})
+        self.prune()
+        return {"zip_path": self._zip_path(key), "zip_filename": zip_filename, "trace": trace, "drive": {}}
+
+    def record_upload(self, key, folder_id, file_id):
+        """Registra o id do arquivo criado no Drive para esta entrada e pasta."""
+        with self._lock:
+            try:
+                info = self._read_info(key)
+            except (OSError, ValueError):
+                return
+            info.setdefault("drive", {})[folder_id or ""] = file_id
+            self._write_info(key, info)
+
+    def drive_file_id(self, key, folder_id):
+        try:
+            return self._read_info(key).get("drive", {}).get(folder_id or "")
+        except (OSError, ValueError):
+            return None
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".zip") or name.startswith("."):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name[:-len(".zip")]))
+        return entries
+
+    def _remove(self, key):
+        for path in (self._zip_path(key), self._info_path(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def prune(self):
+        """Remove entradas vencidas e, se passar do limite, as usadas há mais tempo."""
+        with self._lock:
+            cutoff = time.time() - self.ttl_hours * 3600
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for last_used, size, key in entries:
+                if last_used >= cutoff and total <= self.max_bytes:
+                    break
+                self._remove(key)
+                total -= size
+                removed += 1
+            return removed
+
+
+_default_cache = None
+_cache_lock = threading.Lock()
+
+def get_artifact_cache():
+    """Cache único por processo; o diretório pode ser compartilhado entre processos."""
+    global _default_cache
+    with _cache_lock:
+        if _default_cache is None:
+            _default_cache = ArtifactCache()
+        return _default_cache
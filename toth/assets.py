@@ -0,0 +1,199 @@
+"""Registro dos arquivos estáticos do app: logos, fontes e miniaturas dos estilos.
+
+Cada arquivo é lido uma vez por processo e compartilhado por todas as sessões, junto
+com o que é derivado dele (a logo já redimensionada, a fonte em cada tamanho, as
+miniaturas e a logo do cabeçalho reduzidas para exibição). O registro guarda a data
+de modificação e o tamanho de cada arquivo e confere os dois a cada acesso: um
+arquivo alterado no disco é recarregado.
+invalidate() descarta na hora um arquivo (ou todos) e refresh() confere todos de uma
+vez; quem mantém caches derivados (ex.: números pré-renderizados) registra um
+callback com on_invalidate(). Caches que sobrevivem ao processo (livros em disco)
+usam fingerprint(), o hash do conteúdo, na chave.
+
+Os workers de renderização em processos não herdam este registro: cada um carrega
+os arquivos na primeira página que renderiza.
+"""
+import base64
+import glob
+import hashlib
+import io
+import logging
+import os
+import threading
+
+HEADER_LOGO_PATH = "logo.png"
+FONTS_DIR = "fonts"
+THUMBS_DIR = "thumbs"
+# Largura das versões reduzidas enviadas ao navegador: o dobro da exibida (telas de alta densidade)
+HEADER_LOGO_WIDTH = 460
+STYLE_THUMB_WIDTH = 140
+
+logger = logging.getLogger("toth.assets")
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class AssetRegistry:
+    def __init__(self):
+        # caminho -> {"signature": (mtime_ns, tamanho) ou None, "values": {chave: valor}}
+        self._entries = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def on_invalidate(self, callback):
+        """Chama `callback()` sempre que algum arquivo for descartado."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def _notify(self):
+        for callback in list(self._listeners):
+            callback()
+
+    def _get(self, path, key, loader):
+        """Valor `key` derivado de `path`, calculado por loader(path) só na primeira vez."""
+        signature = _signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            changed = entry is not None and entry["signature"] != signature
+            if entry is None or changed:
+                entry = self._entries[path] = {"signature": signature, "values": {}}
+            values = entry["values"]
+        if changed:
+            self._notify()
+        if key in values:
+            return values[key]
+        value = loader(path) if signature is not None else None
+        with self._lock:
+            values[key] = value
+        return value
+
+    def invalidate(self, path=None):
+        """Descarta um arquivo (ou todos, sem `path`); o próximo acesso lê de novo do disco."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+        self._notify()
+
+    def refresh(self):
+        """Descarta os arquivos alterados no disco desde que foram lidos; devolve quais."""
+        with self._lock:
+            changed = [path for path, entry in self._entries.items() if entry["signature"] != _signature(path)]
+            for path in changed:
+                del self._entries[path]
+        if changed:
+            self._notify()
+        return changed
+
+    def read(self, path):
+        """Conteúdo do arquivo, ou None se ele não existir."""
+        def load(path):
+            with open(path, "rb") as fh:
+                return fh.read()
+        return self._get(path, ("bytes",), load)
+
+
+
+    def fingerprint(self, path):
+        """SHA-256 do conteúdo do arquivo (ou None se ele não existir), para compor chaves de cache."""
+        return self._get(path, ("sha256",), lambda path: hashlib.sha256(self.read(path)).hexdigest())
+
+    def thumbnail(self, path, max_width):
+        """PNG reduzido (sem ampliar) para no máximo `max_width` px de largura, ou None sem o arquivo.
+
+        As miniaturas dos estilos e a logo do cabeçalho têm 1024 px, mas são exibidas com
+        poucas centenas: reduzidas uma vez, cada rerun envia dezenas de KB em vez de MB.
+        """
+        from PIL import Image
+
+        def load(path):
+            with Image.open(path) as img:
+                img.thumbnail((max_width, img.height), Image.LANCZOS)
+                with io.BytesIO() as output:
+                    img.save(output, format="PNG", optimize=True)
+                    return output.getvalue()
+        return self._get(path, ("thumbnail", max_width), load)
+
+    def thumbnail_base64(self, path, max_width):
+        """thumbnail() em base64 (para embutir no HTML), ou "" se o arquivo não existir."""
+        return self._get(path, ("thumbnail_base64", max_width),
+                         lambda path: base64.b64encode(self.thumbnail(path, max_width)).decode()) or ""
+
+    def truetype(self, path, size):
+        """Fonte TrueType no tamanho `size`, ou None se o arquivo não existir ou for inválido."""
+        from PIL import ImageFont
+
+        def load(path):
+            try:
+                return ImageFont.truetype(path, size)
+            except OSError:
+                return None
+        return self._get(path, ("font", size), load)
+
+    def font(self, path, size):
+        """Fonte TrueType no tamanho `size`; sem o arquivo (ou inválido), a fonte padrão do Pillow."""
+        from PIL import ImageFont
+
+        return self.truetype(path, size) or ImageFont.load_default()
+
+    def logo(self, path, max_logo_width=200, scale=1.0):
+        """Logo em RGBA já redimensionada como add_logo_bottom_center a cola, ou None sem o arquivo.
+
+        O tamanho não depende das dimensões da página, só de `scale` (a razão entre a
+        imagem e a página real, menor que 1 nas prévias).
+        """
+        from PIL import Image
+
+        def load(path):
+            logo = Image.open(path)
+            ratio = max_logo_width / logo.width
+            new_w = max(1, int(logo.width * ratio * 0.5 * scale))
+            new_h = max(1, int(logo.height * ratio * 0.5 * scale))
+            logo = logo.resize((new_w, new_h), Image.LANCZOS)
+            if logo.mode != "RGBA":
+                logo = logo.convert("RGBA")
+            return logo
+        return self._get(path, ("logo", max_logo_width, scale), load)
+
+    def preload(self):
+        """Carrega e valida logos, fontes e miniaturas; devolve os problemas encontrados."""
+        from toth.imaging import LOGO_PATH, NUMBER_FONT_DIVISOR, NUMBER_REFERENCE_HEIGHT
+
+        problems = []
+        for path in (HEADER_LOGO_PATH, LOGO_PATH):
+            if self.read(path) is None:
+                problems.append(f"arquivo não encontrado: {path}")
+        self.thumbnail_base64(HEADER_LOGO_PATH, HEADER_LOGO_WIDTH)
+        font_size = int(NUMBER_REFERENCE_HEIGHT / NUMBER_FONT_DIVISOR)
+        for path in sorted(glob.glob(os.path.join(FONTS_DIR, "*.ttf"))):
+            self.read(path)
+            if self.truetype(path, font_size) is None:
+                problems.append(f"fonte inválida: {path}")
+        for path in sorted(glob.glob(os.path.join(THUMBS_DIR, "*.png"))):
+            self.thumbnail(path, STYLE_THUMB_WIDTH)
+        try:
+            self.logo(LOGO_PATH)
+        except OSError as exc:
+            problems.append(f"logo inválida: {LOGO_PATH} ({exc})")
+        for problem in problems:
+            logger.warning(problem)
+        return problems
+
+
+_default_registry = None
+_registry_lock = threading.Lock()
+
+def get_asset_registry():
+    """Registro único por processo, compartilhado entre as sessões."""
+    global _default_registry
+    with _registry_lock:
+        if _default_registry is None:
+            _default_registry = AssetRegistry()
+        return _default_registry
@@ -0,0 +1,237 @@
+"""Geração em lote, sem a interface, a partir de pastas de livros.
+
+Cada subpasta de BOOKS_DIR é um livro: as imagens das páginas e um manifest.json
+com a mesma configuração do app, por exemplo:
+
+    {"book_name": "Meu Livro", "num_start": 3, "num_end": 40, "initial_number": 1,
+     "number_style": "Romano", "custom_color": "#FFFFFF", "alignment": "Central",
+     "include_logo": true, "include_epub_numbering": true}
+
+Chaves ausentes usam os mesmos padrões da interface. As páginas seguem a ordem
+natural dos nomes dos arquivos (pagina2 antes de pagina10), a menos que o manifest
+traga "pages" com a lista de arquivos na ordem desejada.
+"outputs" escolhe os arquivos gerados (padrão: ["pdf", "sangria", "epub"]).
+
+    python -m toth.batch livros/ --output saida/ --workers 2
+
+Os livros são gerados em paralelo (no máximo --workers ao mesmo tempo). O ZIP de cada
+um leva o book_name, sem separadores de pasta nem caracteres inválidos; livros cujos
+nomes coincidem falham, em vez de um sobrescrever o outro. Ao lado de cada ZIP fica
+um .json com a impressão digital do livro (conteúdo das páginas, na ordem, mais a
+configuração); livros cujo ZIP já corresponde a ela são pulados, então basta rodar
+de novo o mesmo comando para retomar um lote interrompido.
+
+Como o app, deve ser executado a partir da raiz do projeto (logo e fontes).
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from toth.artifacts import book_key
+from toth.epub import DEFAULT_EPUB_PROFILE
+from toth.packaging import safe_filename
+from toth.pipeline import DEFAULT_NUMBER_MODE, OUTPUTS, book_outputs, generate_book
+from toth.print_profiles import DEFAULT_PRINT_DPI, DEFAULT_PRINT_PROFILE
+
+MANIFEST_NAME = "manifest.json"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff", ".bmp", ".gif")
+NUMBER_STYLES = ("Padrão", "Romano", "Fresco", "Moderno", "Elegante", "Desenhado")
+ALIGNMENTS = ("Esquerda", "Central", "Direita")
+BATCH_WORKERS = int(os.getenv("TOTH_BATCH_WORKERS", "2"))
+
+GENERATED = "generated"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+
+def _natural_key(name):
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_book(book_dir):
+    """Lê o manifest e as páginas de uma pasta; devolve (arquivos, config) no formato do pipeline."""
+    with open(os.path.join(book_dir, MANIFEST_NAME), encoding="utf-8") as fh:
+        manifest = json.load(fh)
+
+    if "pages" in manifest:
+        names = list(manifest["pages"])
+    else:
+        names = sorted(
+            (name for name in os.listdir(book_dir) if name.lower().endswith(IMAGE_EXTENSIONS)),
+            key=_natural_key
+        )
+    if not names:
+        raise ValueError("nenhuma imagem encontrada")
+
+    files = []
+    for name in names:
+        path = os.path.join(book_dir, name)
+        if not os.path.isfile(path):
+            raise ValueError(f"página não encontrada: {name}")
+        files.append({"name": name, "path": path, "sha256": _file_hash(path)})
+
+    config = {
+        "book_name": manifest.get("book_name") or os.path.basename(os.path.normpath(book_dir)),
+        "num_start": manifest.get("num_start", 1),
+        "num_end": manifest.get("num_end", len(files)),
+        "initial_number": manifest.get("initial_number", 1),
+        "number_style": manifest.get("number_style", "Padrão"),
+        "custom_color": manifest.get("custom_color", "#FFFFFF"),
+        "alignment": manifest.get("alignment", "Central"),
+        "number_mode": manifest.get("number_mode", DEFAULT_NUMBER_MODE),
+        "include_epub_numbering": manifest.get("include_epub_numbering", True),
+        "epub_profile": manifest.get("epub_profile", DEFAULT_EPUB_PROFILE),
+        "include_logo": manifest.get("include_logo", True),
+        "print_profile": manifest.get("print_profile", DEFAULT_PRINT_PROFILE),
+        "print_dpi": manifest.get("print_dpi", DEFAULT_PRINT_DPI),
+        "outputs": manifest.get("outputs", list(OUTPUTS)),
+    }
+    if config["number_style"] not in NUMBER_STYLES:
+        raise ValueError(f"estilo de numeração desconhecido: {config['number_style']}")
+    if config["alignment"] not in ALIGNMENTS:
+        raise ValueError(f"alinhamento desconhecido: {config['alignment']}")
+    book_outputs(config)
+    return files, config
+
+def _output_paths(output_dir, config):
+    zip_path = os.path.join(output_dir, f"{safe_filename(config['book_name'])}.zip")
+    return zip_path, zip_path + ".json"
+
+def _output_name(book_dir):
+    """Nome do ZIP do livro, só pelo manifest (sem ler as páginas); None se o manifest for inválido."""
+    try:
+        with open(os.path.join(book_dir, MANIFEST_NAME), encoding="utf-8") as fh:
+            book_name = json.load(fh).get("book_name")
+    except (OSError, ValueError, AttributeError):
+        return None
+    return safe_filename(book_name or os.path.basename(os.path.normpath(book_dir)))
+
+def is_up_to_date(output_dir, files, config):
+    zip_path, info_path = _output_paths(output_dir, config)
+    if not os.path.exists(zip_path):
+        return False
+    try:
+        with open(info_path, encoding="utf-8") as fh:
+            return json.load(fh).get("fingerprint") == book_key(files, config)
+    except (OSError, ValueError):
+        return False
+
+def build_book(book_dir, output_dir, force=False):
+    """Gera (ou pula, se já estiver atualizado) um livro e devolve o relatório dele."""
+    started = time.perf_counter()
+    report = {"book": os.path.basename(os.path.normpath(book_dir)), "status": None, "seconds": None}
+    try:
+        files, config = load_book(book_dir)
+        report["pages"] = len(files)
+        if not force and is_up_to_date(output_dir, files, config):
+            report["status"] = SKIPPED
+            return report
+
+        result = generate_book(files, config)
+        zip_path, info_path = _output_paths(output_dir, config)
+        # O ZIP só aparece com o nome final depois de completo; a impressão digital vem por último
+        tmp_path = zip_path + ".part"
+        shutil.move(result["zip_path"], tmp_path)
+        os.replace(tmp_path, zip_path)
+        with open(info_path, "w", encoding="utf-8") as fh:
+            json.dump({"fingerprint": book_key(files, config), "trace": result["trace"]}, fh, indent=2, ensure_ascii=False)
+
+        report["status"] = GENERATED
+        report["output"] = zip_path
+        report["stages"] = {stage["stage"]: stage["duration_s"] for stage in result["trace"]["stages"]}
+    except Exception as exc:
+        report["status"] = FAILED
+        report["error"] = f"{type(exc).__name__}: {exc}"
+    finally:
+        report["seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+def find_books(books_dir):
+    return sorted(
+        (os.path.join(books_dir, name) for name in os.listdir(books_dir)
+         if os.path.isfile(os.path.join(books_dir, name, MANIFEST_NAME))),
+        key=_natural_key
+    )
+
+def run_batch(books_dir, output_dir, workers=BATCH_WORKERS, force=False, on_book=None):
+    """Gera todos os livros de `books_dir` com até `workers` em paralelo; devolve os relatórios."""
+    os.makedirs(output_dir, exist_ok=True)
+    books = find_books(books_dir)
+    reports = []
+
+    # Livros com o mesmo nome de saída gravariam o mesmo ZIP (e o mesmo .json da retomada)
+    by_name = {}
+    for book in books:
+        name = _output_name(book)
+        if name is not None:
+            by_name.setdefault(name.casefold(), []).append(book)
+    duplicated = {}
+    for same_name in by_name.values():
+        if len(same_name) > 1:
+            for book in same_name:
+                duplicated[book] = [os.path.basename(os.path.normpath(other)) for other in same_name if other != book]
+    for book, others in duplicated.items():
+        report = {"book": os.path.basename(os.path.normpath(book)), "status": FAILED, "seconds": 0.0,
+                  "error": f"ValueError: book_name repetido em {', '.join(others)}"}
+        reports.append(report)
+        if on_book is not None:
+            on_book(report)
+
+    # Threads bastam: cada livro já distribui a renderização das páginas entre processos
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="toth-batch") as executor:
+        futures = [executor.submit(build_book, book, output_dir, force) for book in books if book not in duplicated]
+        for future in as_completed(futures):
+            report = future.result()
+            reports.append(report)
+            if on_book is not None:
+                on_book(report)
+    order = {os.path.basename(os.path.normpath(book)): i for i, book in enumerate(books)}
+    reports.sort(key=lambda report: order[report["book"]])
+    return reports
+
+def _print_report(report):
+    line = f"{report['status']:>9}  {report['book']}  {report['seconds']:.1f}s"
+    if "pages" in report:
+        line += f"  {report['pages']} páginas"
+    if report["status"] == FAILED:
+        line += f"  {report['error']}"
+    elif report["status"] == GENERATED:
+        line += "  (" + ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in report["stages"].items()
+                                  if "." not in stage) + ")"
+    print(line, flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera os ZIPs de vários livros a partir de pastas com manifest.json")
+    parser.add_argument("books_dir", help="pasta com uma subpasta (imagens + manifest.json) por livro")
+    parser.add_argument("--output", default="livros_gerados", help="pasta dos ZIPs gerados")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="livros gerados ao mesmo tempo")
+    parser.add_argument("--force", action="store_true", help="gera de novo mesmo os livros já atualizados")
+    parser.add_argument("--report", help="grava o relatório por livro neste arquivo JSON")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    reports = run_batch(args.books_dir, args.output, workers=args.workers, force=args.force, on_book=_print_report)
+    counts = {status: sum(1 for r in reports if r["status"] == status) for status in (GENERATED, SKIPPED, FAILED)}
+    print(f"{len(reports)} livros em {time.perf_counter() - started:.1f}s: {counts[GENERATED]} gerados, "
+          f"{counts[SKIPPED]} já atualizados, {counts[FAILED]} com falha")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as fh:
+            json.dump(reports, fh, indent=2, ensure_ascii=False)
+    return 1 if counts[FAILED] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,601 @@
+"""Benchmark do pipeline do livro, executável offline.
+
+Gera livros sintéticos (tamanhos de página e modos de cor variados, em JPEG ou PNG)
+e mede tempo de relógio, tempo de CPU e pico de RSS de cada etapa isolada e da
+geração completa. O resultado vai para um JSON que pode ser comparado com o de
+outro commit:
+
+    python -m toth.benchmark --output bench.json
+    python -m toth.benchmark --pages 10 100 --compare bench.json
+
+Com --compare, o código de saída é 1 se alguma etapa ficar mais lenta que a
+tolerância em relação à referência.
+
+Também mede, em processos novos, quanto o import do streamlit_app custa além do
+próprio Streamlit (o que cada partida a frio do container paga antes da primeira
+página) e confere que as integrações pesadas não são carregadas nesse momento. Com o
+pypdf instalado, confere ainda que o texto extraído de cada página do PDF com
+numeração vetorial é exatamente o número dela, e em qualquer caso que a logo e as
+miniaturas enviadas ao navegador estão reduzidas e que cancelar a geração no meio do
+EPUB a interrompe em todos os backends de gravação. O código de saída é 1 se alguma
+verificação falhar; --check roda só elas, em segundos, sem gravar o JSON (para CI
+ou antes de um deploy):
+
+    python -m toth.benchmark --check --import-budget-ms 150
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from PIL import Image, ImageDraw
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    from pypdf import PdfReader
+    from pypdf.generic import ContentStream
+except ImportError:  # opcional: só a conferência do texto do PDF vetorial usa
+    PdfReader = ContentStream = None
+
+import toth.render as render
+from toth.assets import HEADER_LOGO_PATH, HEADER_LOGO_WIDTH, STYLE_THUMB_WIDTH, THUMBS_DIR, get_asset_registry
+from toth.epub import DEFAULT_EPUB_PROFILE, clear_image_cache, generate_epub
+from toth.imaging import LOGO_PATH, STYLE_COLORS, STYLE_OUTLINES, add_logo_bottom_center, add_page_number, scale_and_crop_to_fill
+from toth.jobs import JobCancelled
+from toth.pdf import generate_pdf, generate_pdf_sangria, vector_numbers
+from toth.pipeline import generate_book
+from toth.print_profiles import DEFAULT_PRINT_DPI, DEFAULT_PRINT_PROFILE, bleed_page_size
+
+DEFAULT_PAGES = (10, 100, 500)
+DEFAULT_FORMATS = ("JPEG", "PNG")
+# Tamanhos misturados: digitalizações A5 e A4 a 150/300 dpi e a referência de 2775 px
+PAGE_SIZES = ((1240, 1754), (1800, 2775), (2480, 3508), (874, 1240))
+STAGES = (
+    "end_to_end",
+    "add_page_number",
+    "add_logo_bottom_center",
+    "scale_and_crop_to_fill",
+    "render_pages",
+    "generate_pdf",
+    "generate_pdf_sangria",
+    "generate_epub",
+)
+# Abaixo disso a variação entre execuções é maior que qualquer regressão real
+MIN_COMPARABLE_SECONDS = 0.05
+# Orçamento do import do app, descontado o Streamlit, e o que só deve carregar sob demanda
+IMPORT_BUDGET_MS = float(os.getenv("TOTH_IMPORT_BUDGET_MS", "150"))
+# Tamanho máximo de cada imagem reduzida que o app envia ao navegador a cada rerun
+MAX_DISPLAY_ASSET_BYTES = 200 * 1024
+LAZY_MODULES = ("openai", "googleapiclient", "google.oauth2", "ebooklib", "PIL")
+_IMPORT_PROBE = """
+import json, sys, time
+import streamlit
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def _cpu_time():
+    # Inclui os processos filhos já encerrados (pool de renderização)
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+def _reset_peak_rss():
+    """Zera o pico de RSS do processo (Linux); devolve False se não for possível."""
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+        return True
+    except OSError:
+        return False
+
+def _peak_rss():
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageMeter:
+    """Acumula tempo de relógio e de CPU das chamadas de uma etapa.
+
+    Pode ser usado várias vezes como context manager (uma por página), para que a
+    preparação das entradas fique fora da medição. O pico de RSS cobre o intervalo
+    inteiro desde a criação; sem /proc/self/clear_refs ele é o pico do processo.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.calls = 0
+        self.bytes_out = 0
+        self._peak_scope = "stage" if _reset_peak_rss() else "process"
+
+    def __enter__(self):
+        self._wall_start = time.perf_counter()
+        self._cpu_start = _cpu_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wall += time.perf_counter() - self._wall_start
+        self.cpu += _cpu_time() - self._cpu_start
+        self.calls += 1
+
+    def result(self, **extra):
+        peak = _peak_rss()
+        return {
+            "stage": self.name,
+            "wall_s": round(self.wall, 4),
+            "cpu_s": round(self.cpu, 4),
+            "calls": self.calls,
+            "bytes_out": self.bytes_out,
+            "peak_rss_mb": None if peak is None else round(peak / (1024 * 1024), 1),
+            "peak_rss_scope": self._peak_scope,
+            **extra,
+        }
+
+
+def _base_image(size):
+    # Ruído suavizado sobre gradientes: comprime como uma ilustração, não como uma cor lisa
+    w, h = size
+    noise = Image.effect_noise((max(1, w // 8), max(1, h // 8)), 48).resize(size, Image.BILINEAR)
+    horizontal = Image.linear_gradient("L").resize(size)
+    vertical = Image.linear_gradient("L").rotate(90).resize(size)
+    return Image.merge("RGB", (noise, horizontal, vertical))
+
+def synthetic_book(pages, fmt, directory, seed=0):
+    """Grava um livro sintético em `directory` e devolve as entradas no formato do app."""
+    rng = random.Random(seed)
+    bases = {}
+    files = []
+    ext = "jpg" if fmt == "JPEG" else "png"
+    os.makedirs(directory, exist_ok=True)
+    for index in range(pages):
+        size = PAGE_SIZES[index % len(PAGE_SIZES)]
+        if size not in bases:
+            bases[size] = _base_image(size)
+        img = bases[size].copy()
+        # Conteúdo único por página, senão os caches endereçados por hash mascaram o custo
+        draw = ImageDraw.Draw(img)
+        x, y = rng.randrange(size[0] // 2), rng.randrange(size[1] // 2)
+        draw.rectangle((x, y, x + size[0] // 3, y + size[1] // 5), fill=tuple(rng.randrange(256) for _ in range(3)))
+        draw.text((x + 10, y + 10), f"{index + 1}", fill="white")
+        if index % 7 == 3:
+            img = img.convert("L")
+
+        path = os.path.join(directory, f"page_{index + 1:04d}.{ext}")
+        if fmt == "JPEG":
+            img.save(path, format="JPEG", quality=90)
+        else:
+            img.save(path, format="PNG")
+        with open(path, "rb") as fh:
+            sha256 = render.content_hash(fh.read())
+        files.append({"name": os.path.basename(path), "sha256": sha256, "path": path})
+    return files
+
+def _clear_caches():
+    render.PAGE_CACHE.clear()
+    clear_image_cache()
+
+def _book_config(pages):
+    return {
+        "book_name": "benchmark",
+        "num_start": min(2, pages),
+        "num_end": max(pages - 1, 1),
+        "initial_number": 1,
+        "number_style": "Padrão",
+        "custom_color": "#FFFFFF",
+        "alignment": "Central",
+        "include_epub_numbering": True,
+        "epub_profile": DEFAULT_EPUB_PROFILE,
+        "include_logo": True,
+        "print_profile": DEFAULT_PRINT_PROFILE,
+        "print_dpi": DEFAULT_PRINT_DPI,
+    }
+
+def _open_rgb(path):
+    img = Image.open(path)
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+def _run_end_to_end(files, config):
+    _clear_caches()
+    stage_walls = {}
+    started = {}
+
+    def progress(stage, done, total):
+        now = time.perf_counter()
+        started.setdefault(stage, now)
+        if done >= total:
+            stage_walls[stage] = round(now - started[stage], 4)
+
+    meter = StageMeter("end_to_end")
+    with meter:
+        result = generate_book(files, config, progress=progress)
+    meter.bytes_out = os.path.getsize(result["zip_path"])
+    os.remove(result["zip_path"])
+    return meter.result(pipeline_stages=stage_walls)
+
+def _run_per_page(name, files, fn):
+    meter = StageMeter(name)
+    for position, f_dict in enumerate(files, start=1):
+        img = _open_rgb(f_dict["path"])
+        img.load()
+        with meter:
+            fn(img, position)
+    return meter.result()
+
+def _write_file(meter, directory, filename, write):
+    path = os.path.join(directory, filename)
+    with open(path, "wb") as output:
+        with meter:
+            write(output)
+    meter.bytes_out = os.path.getsize(path)
+    os.remove(path)
+    return meter.result()
+
+def run_scenario(pages, fmt, workdir, stages=STAGES):
+    """Mede as etapas escolhidas para um livro sintético de `pages` páginas."""
+    book_dir = os.path.join(workdir, f"book-{pages}-{fmt.lower()}")
+    files = synthetic_book(pages, fmt, book_dir)
+    config = _book_config(pages)
+    results = []
+
+    if "end_to_end" in stages:
+        # Primeiro, com os caches frios, como numa geração nova em produção
+        results.append(_run_end_to_end(files, config))
+
+    if "add_page_number" in stages:
+        results.append(_run_per_page("add_page_number", files, lambda img, pos: add_page_number(
+            img, pos, config["alignment"], config["number_style"], config["custom_color"])))
+    if "add_logo_bottom_center" in stages:
+        results.append(_run_per_page("add_logo_bottom_center", files, lambda img, pos: add_logo_bottom_center(img, LOGO_PATH)))
+    if "scale_and_crop_to_fill" in stages:
+        target_w, target_h = bleed_page_size(DEFAULT_PRINT_PROFILE, DEFAULT_PRINT_DPI)
+        results.append(_run_per_page("scale_and_crop_to_fill", files, lambda img, pos: scale_and_crop_to_fill(img, target_w, target_h)))
+
+    rendered = None
+    if any(stage in stages for stage in ("render_pages", "generate_pdf", "generate_pdf_sangria", "generate_epub")):
+        _clear_caches()
+        jobs = render.build_page_jobs(
+            files,
+            config["num_start"],
+            config["num_end"],
+            config["initial_number"],
+            config["alignment"],
+            config["number_style"],
+            custom_color=config["custom_color"],
+            include_logo=config["include_logo"]
+        )
+        meter = StageMeter("render_pages")
+        with meter:
+            rendered = [page["data"] for page in render.render_pages(jobs)]
+        meter.bytes_out = sum(len(data) for data in rendered)
+        if "render_pages" in stages:
+            results.append(meter.result())
+
+    if "generate_pdf" in stages:
+        results.append(_write_file(StageMeter("generate_pdf"), workdir, "bench.pdf",
+                                   lambda output: generate_pdf(rendered, output=output)))
+    if "generate_pdf_sangria" in stages:
+        results.append(_write_file(StageMeter("generate_pdf_sangria"), workdir, "bench_sangria.pdf",
+                                   lambda output: generate_pdf_sangria(rendered, output=output)))
+    if "generate_epub" in stages:
+        clear_image_cache()
+        epub_files = [{"name": f["name"], "data": data} for f, data in zip(files, rendered)]
+        results.append(_write_file(StageMeter("generate_epub"), workdir, "bench.epub", lambda output: generate_epub(
+            epub_files,
+            config["num_start"],
+            config["num_end"],
+            config["initial_number"],
+            config["alignment"],
+            config["number_style"],
+            custom_color=config["custom_color"],
+            add_numbering=config["include_epub_numbering"],
+            output=output,
+            profile=config["epub_profile"]
+        )))
+
+    return {
+        "scenario": f"{pages}-{fmt}",
+        "pages": pages,
+        "format": fmt,
+        "input_bytes": sum(os.path.getsize(f["path"]) for f in files),
+        "stages": results,
+    }
+
+def measure_imports(module="streamlit_app", repeat=5, budget_ms=IMPORT_BUDGET_MS):
+    """Mede o import de `module` em `repeat` interpretadores novos (mediana, em ms)."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = _IMPORT_PROBE.format(module=module, lazy=LAZY_MODULES)
+    runs = []
+    loaded = set()
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+        probe = json.loads(completed.stdout.strip().splitlines()[-1])
+        runs.append(probe["seconds"] * 1000)
+        loaded.update(probe["loaded"])
+    runs.sort()
+    median = runs[len(runs) // 2]
+    return {
+        "module": module,
+        "median_ms": round(median, 1),
+        "runs_ms": [round(ms, 1) for ms in runs],
+        "budget_ms": budget_ms,
+        "eagerly_loaded": sorted(loaded),
+        "within_budget": median <= budget_ms and not loaded,
+    }
+
+def _extract_text(pdf_page):
+    """Texto da página sem o conteúdo marcado como /Artifact (como os leitores de PDF marcado)."""
+    artifact = []
+    parts = []
+
+    def before(operator, operands, cm, tm):
+        if operator in (b"BMC", b"BDC"):
+            artifact.append(operands[0] == "/Artifact" or bool(artifact and artifact[-1]))
+        elif operator == b"EMC" and artifact:
+            artifact.pop()
+
+    def text(value, cm, tm, font, size):
+        if not (artifact and artifact[-1]):
+            parts.append(value)
+
+    pdf_page.extract_text(visitor_operand_before=before, visitor_text=text)
+    return "".join(parts).strip()
+
+def _render_modes(pdf_page):
+    """Modo de pintura (Tr) de cada texto desenhado na página, na ordem do conteúdo."""
+    modes, mode = [], 0
+    for operands, operator in ContentStream(pdf_page.get_contents(), pdf_page.pdf).operations:
+        if operator == b"Tr":
+            mode = int(operands[0])
+        elif operator in (b"Tj", b"TJ"):
+            modes.append(mode)
+    return modes
+
+def check_asset_sizes(max_bytes=MAX_DISPLAY_ASSET_BYTES):
+    """Confere que a logo do cabeçalho e as miniaturas dos estilos vão reduzidas ao navegador.
+
+    Devolve a lista de problemas (arquivo, largura e bytes da versão enviada).
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    registry = get_asset_registry()
+    targets = [(HEADER_LOGO_PATH, HEADER_LOGO_WIDTH)]
+    targets += [(os.path.relpath(path, root), STYLE_THUMB_WIDTH)
+                for path in sorted(glob.glob(os.path.join(root, THUMBS_DIR, "*.png")))]
+    problems = []
+    for path, max_width in targets:
+        data = registry.thumbnail(os.path.join(root, path), max_width)
+        if data is None:
+            continue
+        with Image.open(io.BytesIO(data)) as img:
+            width = img.width
+        if width > max_width or len(data) > max_bytes:
+            problems.append({"path": path, "width": width, "max_width": max_width, "bytes": len(data)})
+    return problems
+
+def check_vector_text(pages=12):
+    """Confere, em cada estilo, a numeração de cada página do PDF vetorial.
+
+    O texto extraído deve ser exatamente o número, e o contorno (1 Tr) deve ser pintado
+    antes do preenchimento (0 Tr), que fica por cima, como na numeração rasterizada.
+    Devolve a lista de divergências, ou None se o pypdf não estiver instalado.
+    """
+    if PdfReader is None:
+        return None
+    page = Image.new("RGB", (620, 877), "gray")
+    mismatches = []
+    for style in STYLE_COLORS:
+        numbers = vector_numbers(pages, 2, pages, 1, style, None, "Central")
+        expected_modes = ([1] if STYLE_OUTLINES.get(style, 1) > 0 else []) + [0]
+        # O PDF com sangria a 72 dpi usa o mesmo JpegPdfWriter dos dois PDFs, com páginas pequenas
+        reader = PdfReader(generate_pdf_sangria([page] * pages, dpi=72, numbers=numbers))
+        for position, (pdf_page, number) in enumerate(zip(reader.pages, numbers), start=1):
+            expected = number["text"] if number is not None else ""
+            extracted = _extract_text(pdf_page)
+            if extracted != expected:
+                mismatches.append({"style": style, "position": position, "expected": expected, "extracted": extracted})
+            modes = _render_modes(pdf_page)
+            if number is not None and modes != expected_modes:
+                mismatches.append({"style": style, "position": position,
+                                   "expected": f"Tr {expected_modes}", "extracted": f"Tr {modes}"})
+    return mismatches
+
+def check_epub_cancel(pages=12, workdir=None):
+    """Confere que cancelar a geração no meio do EPUB a interrompe, em cada backend de gravação.
+
+    O cancelamento vem do callback de progresso, como no JobManager, depois de um quarto
+    do tempo que o EPUB leva inteiro; a geração deve parar (JobCancelled) bem antes do
+    fim do EPUB. Devolve a lista dos backends em que isso não aconteceu.
+    """
+    problems = []
+    with tempfile.TemporaryDirectory(prefix="toth-bench-", dir=workdir) as tmp:
+        files = synthetic_book(pages, "JPEG", tmp)
+        config = dict(_book_config(pages), outputs=("pdf", "epub"))
+        _clear_caches()
+        result = generate_book(files, config)
+        os.remove(result["zip_path"])
+        epub_s = next(stage["duration_s"] for stage in result["trace"]["stages"] if stage["stage"] == "epub")
+
+        for backend in ("serial", "thread", "process"):
+            started = []
+            cancelled_at = []
+
+            def progress(stage, done, total):
+                if stage != "epub" or done:
+                    return
+                now = time.perf_counter()
+                started.append(now)
+                if now - started[0] >= epub_s / 4:
+                    cancelled_at.append(now)
+                    raise JobCancelled()
+
+            # Sem o cache, o EPUB converte as páginas de novo e leva o mesmo tempo
+            _clear_caches()
+            try:
+                result = generate_book(files, dict(config, writer_backend=backend), progress=progress)
+            except JobCancelled:
+                latency = time.perf_counter() - cancelled_at[0]
+                if latency > epub_s / 2:
+                    problems.append({"backend": backend, "latency_s": round(latency, 3), "epub_s": epub_s})
+            else:
+                os.remove(result["zip_path"])
+                problems.append({"backend": backend, "latency_s": None, "epub_s": epub_s})
+    return problems
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(pages=DEFAULT_PAGES, formats=DEFAULT_FORMATS, stages=STAGES, workdir=None,
+                  import_budget_ms=IMPORT_BUDGET_MS):
+    imports = measure_imports(budget_ms=import_budget_ms)
+    print(f"import do app: {imports['median_ms']} ms (orçamento {import_budget_ms:g} ms)"
+          f"; carregados antes da hora: {', '.join(imports['eagerly_loaded']) or 'nenhum'}", flush=True)
+    asset_sizes = check_asset_sizes()
+    print(f"logo e miniaturas enviadas ao navegador: {len(asset_sizes)} acima do limite", flush=True)
+    vector_text = check_vector_text()
+    print("texto do PDF vetorial: " + ("pypdf não instalado, conferência pulada" if vector_text is None
+                                       else f"{len(vector_text)} divergência(s)"), flush=True)
+    epub_cancel = check_epub_cancel(workdir=workdir)
+    print(f"cancelamento no meio do EPUB: {len(epub_cancel)} backend(s) sem interromper", flush=True)
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "pillow": Image.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "render_backend": render.RENDER_BACKEND,
+            "render_workers": render.RENDER_WORKERS,
+        },
+        "imports": imports,
+        "vector_text_mismatches": vector_text,
+        "asset_size_problems": asset_sizes,
+        "epub_cancel_problems": epub_cancel,
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory(prefix="toth-bench-", dir=workdir) as tmp:
+        for count in pages:
+            for fmt in formats:
+                scenario = run_scenario(count, fmt, tmp, stages)
+                report["results"].append(scenario)
+                for stage in scenario["stages"]:
+                    print(f"{scenario['scenario']:>10} {stage['stage']:<24} wall {stage['wall_s']:8.3f}s"
+                          f"  cpu {stage['cpu_s']:8.3f}s  pico {stage['peak_rss_mb']} MB", flush=True)
+    return report
+
+def compare(report, baseline, tolerance):
+    """Lista as etapas mais lentas que a referência além da tolerância (fração)."""
+    reference = {
+        (scenario["scenario"], stage["stage"]): stage
+        for scenario in baseline["results"] for stage in scenario["stages"]
+    }
+    regressions = []
+    for scenario in report["results"]:
+        for stage in scenario["stages"]:
+            before = reference.get((scenario["scenario"], stage["stage"]))
+            if before is None or before["wall_s"] < MIN_COMPARABLE_SECONDS:
+                continue
+            ratio = stage["wall_s"] / before["wall_s"]
+            if ratio > 1 + tolerance:
+                regressions.append({
+                    "scenario": scenario["scenario"],
+                    "stage": stage["stage"],
+                    "before_s": before["wall_s"],
+                    "after_s": stage["wall_s"],
+                    "ratio": round(ratio, 2),
+                })
+    return regressions
+
+def check_status(report):
+    """Imprime as verificações que falharam no relatório; devolve o código de saída (0 ou 1)."""
+    status = 0
+    if not report["imports"]["within_budget"]:
+        print("ORÇAMENTO DE IMPORT ESTOURADO")
+        status = 1
+    for item in report["asset_size_problems"]:
+        print(f"ARQUIVO GRANDE DEMAIS PARA EXIBIR {item['path']}: {item['width']} px (máximo {item['max_width']}), "
+              f"{item['bytes']} bytes")
+        status = 1
+    for item in report["vector_text_mismatches"] or ():
+        print(f"NUMERAÇÃO DO PDF VETORIAL {item['style']} página {item['position']}: "
+              f"esperado {item['expected']!r}, extraído {item['extracted']!r}")
+        status = 1
+    for item in report["epub_cancel_problems"]:
+        waited = "não interrompeu" if item["latency_s"] is None else f"parou {item['latency_s']}s depois"
+        print(f"CANCELAMENTO DO EPUB IGNORADO no backend {item['backend']}: {waited} (EPUB inteiro: {item['epub_s']}s)")
+        status = 1
+    return status
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline de geração do livro")
+    parser.add_argument("--pages", type=int, nargs="+", default=list(DEFAULT_PAGES))
+    parser.add_argument("--formats", nargs="+", choices=DEFAULT_FORMATS, default=list(DEFAULT_FORMATS))
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--output", default="bench_results.json", help="arquivo JSON com os resultados")
+    parser.add_argument("--workdir", help="diretório para os livros sintéticos (padrão: temporário do sistema)")
+    parser.add_argument("--compare", help="JSON de referência (ex.: gerado no commit anterior)")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="lentidão aceita em relação à referência")
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS,
+                        help="tempo máximo do import do app, além do Streamlit")
+    parser.add_argument("--check", "--imports-only", action="store_true",
+                        help="só as verificações (import do app, imagens exibidas, PDF vetorial e cancelamento), "
+                             "sem cenários nem JSON")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        status = check_status(run_benchmark((), import_budget_ms=args.import_budget_ms))
+        print("OK" if status == 0 else "FALHOU")
+        return status
+
+    report = run_benchmark(args.pages, args.formats, args.stages, args.workdir, args.import_budget_ms)
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+
+    status = check_status(report)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        regressions = compare(report, baseline, args.tolerance)
+        for item in regressions:
+            print(f"REGRESSÃO {item['scenario']} {item['stage']}: {item['before_s']}s -> {item['after_s']}s ({item['ratio']}x)")
+        if regressions:
+            return 1
+        print(f"Sem regressões acima de {args.tolerance:.0%} em relação a {args.compare}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""Envio do ZIP do livro ao Google Drive.
+
+O cliente da API (documento de descoberta e credenciais) é criado uma única vez por
+conta de serviço e reaproveitado; cada envio usa a própria conexão HTTP, já que os
+objetos do httplib2 não podem ser compartilhados entre threads. O arquivo é enviado
+em partes por upload resumível, lido direto do disco, e falhas de rede ou respostas
+5xx/429 são repetidas com backoff exponencial, retomando do último byte confirmado.
+
+As bibliotecas do Google só são importadas no primeiro envio: elas pesam na
+inicialização e o Drive só é usado depois que um livro é gerado.
+"""
+import io
+import json
+import os
+import random
+import socket
+import time
+from functools import lru_cache
+
+SCOPES = ['https://www.googleapis.com/auth/drive']
+# Permite apontar o cliente para outro servidor (ex.: um Drive falso local nos testes)
+DRIVE_ROOT_URL = os.getenv("TOTH_DRIVE_ROOT_URL")
+# Tamanho de cada parte do upload; precisa ser múltiplo de 256 KB
+UPLOAD_CHUNK_SIZE = int(os.getenv("TOTH_DRIVE_CHUNK_MB", "8")) * 1024 * 1024
+UPLOAD_MAX_RETRIES = int(os.getenv("TOTH_DRIVE_MAX_RETRIES", "6"))
+
+_RETRIABLE_STATUS = (408, 429, 500, 502, 503, 504)
+
+
+@lru_cache(maxsize=4)
+def get_drive_client(service_account_json=None, root_url=DRIVE_ROOT_URL):
+    """Devolve (service, credentials), criados uma vez por conta de serviço e servidor."""
+    from google.auth.credentials import AnonymousCredentials
+    from google.oauth2 import service_account
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+
+    if service_account_json:
+        service_account_info = json.loads(service_account_json)
+        credentials = service_account.Credentials.from_service_account_info(service_account_info, scopes=SCOPES)
+    else:
+        credentials = AnonymousCredentials()
+
+    # Usa o documento de descoberta embutido na biblioteca, sem requisição de rede
+    discovery_doc = json.loads(get_static_doc("drive", "v3"))
+    if root_url:
+        root_url = root_url.rstrip("/") + "/"
+        discovery_doc["rootUrl"] = root_url
+        discovery_doc["baseUrl"] = root_url + discovery_doc["servicePath"]
+    service = build_from_document(discovery_doc, credentials=credentials)
+    return service, credentials
+
+def file_exists(file_id, service_account_json=None, root_url=DRIVE_ROOT_URL):
+    """Indica se o arquivo ainda existe no Drive (e não está na lixeira)."""
+    import google_auth_httplib2
+    from googleapiclient.errors import HttpError
+    from googleapiclient.http import build_http
+
+    service, credentials = get_drive_client(service_account_json, root_url)
+    http = google_auth_httplib2.AuthorizedHttp(credentials, http=build_http())
+    try:
+        metadata = service.files().get(fileId=file_id, fields="id,trashed", supportsAllDrives=True).execute(http=http)
+    except HttpError as exc:
+        if exc.resp.status == 404:
+            return False
+        raise
+    return not metadata.get("trashed", False)
+
+def _is_retriable(exc):
+    import httplib2
+    from googleapiclient.errors import HttpError
+
+    if isinstance(exc, HttpError):
+        return exc.resp.status in _RETRIABLE_STATUS
+    return isinstance(exc, (OSError, socket.timeout, httplib2.HttpLib2Error, ConnectionError))
+
+def upload_file(source, filename, folder_id=None, service_account_json=None, root_url=DRIVE_ROOT_URL,
+                mimetype="application/zip", chunk_size=UPLOAD_CHUNK_SIZE, max_retries=UPLOAD_MAX_RETRIES,
+                progress=None, sleep=time.sleep):
+    """Envia `source` (caminho ou bytes) ao Drive e devolve o id do arquivo criado.
+
+    `progress(enviados, total)` é chamado a cada parte confirmada pelo servidor.
+    """
+    import google_auth_httplib2
+    from googleapiclient.http import MediaIoBaseUpload, build_http
+
+    service, credentials = get_drive_client(service_account_json, root_url)
+    # build_http não trata o 308 do upload resumível como redirecionamento
+    http = google_auth_httplib2.AuthorizedHttp(credentials, http=build_http())
+
+    file_metadata = {
+        'name': filename,
+        'mimeType': mimetype
+    }
+    if folder_id:
+        file_metadata['parents'] = [folder_id]
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        stream = io.BytesIO(source)
+    else:
+        stream = open(source, "rb")
+    with stream:
+        media = MediaIoBaseUpload(stream, mimetype=mimetype, chunksize=chunk_size, resumable=True)
+        total = media.size()
+        request = service.files().create(body=file_metadata, media_body=media, fields='id')
+
+        response = None
+        failures = 0
+        while response is None:
+            try:
+                status, response = request.next_chunk(http=http)
+            except Exception as exc:
+                if not _is_retriable(exc) or failures >= max_retries:
+                    raise
+                failures += 1
+                # Backoff exponencial com jitter; a próxima chamada consulta o servidor e retoma
+                sleep(min(64, 2 ** failures) * (0.5 + random.random() / 2))
+                continue
+            failures = 0
+            if status is not None and progress is not None:
+                progress(status.resumable_progress, total)
+
+    if progress is not None:
+        progress(total, total)
+    return response.get('id')
@@ -0,0 +1,217 @@
+"""Geração do EPUB do livro.
+
+As imagens das páginas passam por um perfil de otimização conforme o aparelho de
+leitura: tamanho máximo, qualidade JPEG, JPEG progressivo e, opcionalmente, uma
+versão WebP oferecida via <picture>, com o JPEG como alternativa para leitores sem
+suporte. Cada imagem é convertida uma única vez por perfil e fica em cache.
+
+ebooklib e Pillow só são importados quando um EPUB é gerado, para que a interface
+possa ler os perfis sem carregá-los.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from toth.store import read_source
+
+# max_size: maior lado em pixels (None mantém); quality None mantém os bytes originais
+EPUB_PROFILES = {
+    "phone": {"label": "Celular", "max_size": 1280, "quality": 70, "progressive": True, "webp": True},
+    "tablet": {"label": "Tablet", "max_size": 2048, "quality": 80, "progressive": True, "webp": False},
+    "archival": {"label": "Arquivo (resolução original)", "max_size": None, "quality": None, "progressive": False, "webp": False},
+}
+DEFAULT_EPUB_PROFILE = "tablet"
+EPUB_CACHE_MB = int(os.getenv("TOTH_EPUB_CACHE_MB", "256"))
+
+_MEDIA_TYPES = {
+    "JPEG": ("image/jpeg", "jpg"),
+    "PNG": ("image/png", "png"),
+    "GIF": ("image/gif", "gif"),
+    "WEBP": ("image/webp", "webp"),
+}
+
+_image_cache = OrderedDict()
+_image_cache_size = 0
+_image_cache_lock = threading.Lock()
+
+
+def _media_type(data):
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        return _MEDIA_TYPES.get(img.format, ("image/jpeg", "jpg"))
+
+def _encode_epub_image(data, profile):
+    settings = EPUB_PROFILES[profile]
+    if settings["quality"] is None:
+        media_type, ext = _media_type(data)
+        return {"data": data, "media_type": media_type, "ext": ext, "webp": None}
+
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(data))
+    max_size = settings["max_size"]
+    if max_size:
+        # Em JPEGs o draft já reduz a imagem na decodificação, antes do redimensionamento fino
+        img.draft("RGB", (max_size, max_size))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if max_size:
+        img.thumbnail((max_size, max_size), Image.LANCZOS)
+
+    with io.BytesIO() as output:
+        img.save(output, format="JPEG", quality=settings["quality"], optimize=True,
+                 progressive=settings["progressive"])
+        jpeg_data = output.getvalue()
+    webp_data = None
+    if settings["webp"]:
+        with io.BytesIO() as output:
+            img.save(output, format="WEBP", quality=settings["quality"], method=4)
+            webp_data = output.getvalue()
+    return {"data": jpeg_data, "media_type": "image/jpeg", "ext": "jpg", "webp": webp_data}
+
+def epub_image(data, profile):
+    """Devolve a imagem da página convertida para o perfil, convertendo só na primeira vez."""
+    global _image_cache_size
+    key = (hashlib.sha256(data).hexdigest(), profile)
+    with _image_cache_lock:
+        entry = _image_cache.get(key)
+        if entry is not None:
+            _image_cache.move_to_end(key)
+            return entry
+
+    entry = _encode_epub_image(data, profile)
+    size = len(entry["data"]) + len(entry["webp"] or b"")
+    with _image_cache_lock:
+        if key not in _image_cache:
+            _image_cache[key] = entry
+            _image_cache_size += size
+        while _image_cache_size > EPUB_CACHE_MB * 1024 * 1024 and _image_cache:
+            _, evicted = _image_cache.popitem(last=False)
+            _image_cache_size -= len(evicted["data"]) + len(evicted["webp"] or b"")
+    return entry
+
+def clear_image_cache():
+    global _image_cache_size
+    with _image_cache_lock:
+        _image_cache.clear()
+        _image_cache_size = 0
+
+@lru_cache(maxsize=None)
+def _spilled_item_class():
+    from ebooklib import epub
+
+    class SpilledEpubItem(epub.EpubItem):
+        """Item cujo conteúdo fica no disco e só é lido quando o EPUB é gravado."""
+
+        def __init__(self, path, **kwargs):
+            super().__init__(**kwargs)
+            self.path = path
+
+        def get_content(self, default=b""):
+            with open(self.path, "rb") as fh:
+                return fh.read()
+
+    return SpilledEpubItem
+
+def generate_epub(files, start_page, end_page, initial_number, alignment, number_style, custom_color=None, add_numbering=True, output=None, profile="archival",
+                  spill_dir=None):
+    """Gera o EPUB; cada página traz "data" (bytes) ou "path" (arquivo no disco).
+
+    Com `spill_dir`, as imagens convertidas são gravadas nessa pasta em vez de ficarem
+    em memória (e fora do cache) até a gravação do EPUB.
+    """
+    from ebooklib import epub
+
+    from toth.imaging import int_to_roman
+
+    book = epub.EpubBook()
+    book.set_identifier("id_livro_123")
+    book.set_title("Livro Ilustrado")
+    book.set_language("pt")
+    book.add_author("Globaltec")
+    
+    html_colors = {
+        "Padrão": custom_color if custom_color else "#FFFFFF",
+        "Romano": custom_color if custom_color else "#FFFFFF",
+        "Fresco": custom_color if custom_color else "#FFD700",
+        "Moderno": custom_color if custom_color else "#007BFF",
+        "Elegante": custom_color if custom_color else "#8E44AD"
+    }
+    
+    def add_image_item(filename, media_type, content):
+        if spill_dir is None:
+            book.add_item(epub.EpubItem(uid=filename, file_name=filename, media_type=media_type, content=content))
+            return
+        path = os.path.join(spill_dir, filename)
+        with open(path, "wb") as fh:
+            fh.write(content)
+        book.add_item(_spilled_item_class()(path, uid=filename, file_name=filename, media_type=media_type))
+
+    chapters = []
+    for idx, f_dict in enumerate(files):
+        page_position = idx + 1
+        data = f_dict["data"] if "data" in f_dict else read_source(f_dict["path"])
+        if spill_dir is None:
+            image = epub_image(data, profile)
+        else:
+            image = _encode_epub_image(data, profile)
+        del data
+        image_filename = f"image_{idx}.{image['ext']}"
+        add_image_item(image_filename, image["media_type"], image["data"])
+
+        image_html = f'<img src="{image_filename}" alt="Página {page_position}" style="width:100%;"/>'
+        if image["webp"] is not None:
+            webp_filename = f"image_{idx}.webp"
+            add_image_item(webp_filename, "image/webp", image["webp"])
+            image_html = f'<picture><source srcset="{webp_filename}" type="image/webp"/>{image_html}</picture>'
+    
+        if add_numbering and start_page <= page_position <= end_page:
+            display_number = initial_number + (page_position - start_page)
+            display_text = int_to_roman(display_number) if number_style == "Romano" else str(display_number)
+            html_color = html_colors.get(number_style, "#FFFFFF")
+            if alignment == "Esquerda":
+                align_style = "text-align:left; margin-left:75px;"
+            elif alignment == "Direita":
+                align_style = "text-align:right; margin-right:75px;"
+            else:
+                align_style = "text-align:center; margin:0 75px;"
+            number_html = f"<div style='{align_style} font-size:16px; margin-top:10px; color:{html_color};'>{display_text}</div>"
+        else:
+            number_html = ""
+    
+        c = epub.EpubHtml(
+            title=f"Página {page_position}",
+            file_name=f"page_{idx}.xhtml",
+            lang="pt"
+        )
+        c.content = f"""
+        <html>
+          <head>
+            <meta charset="utf-8" />
+            <title>Página {page_position}</title>
+          </head>
+          <body>
+            <h1>Página {page_position}</h1>
+            {image_html}
+            {number_html}
+          </body>
+        </html>
+        """
+        book.add_item(c)
+        chapters.append(c)
+    
+    book.toc = tuple(chapters)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ["nav"] + chapters
+    
+    # Com `output`, o EPUB é gravado direto nele (ex.: membro do ZIP final)
+    epub_bytes = io.BytesIO() if output is None else output
+    epub.write_epub(epub_bytes, book)
+    if output is None:
+        epub_bytes.seek(0)
+    return epub_bytes
@@ -0,0 +1,237 @@
+"""Operações de imagem aplicadas a cada página do livro (numeração, logo e enquadramento)."""
+import io
+import math
+import os
+from functools import lru_cache
+
+from PIL import Image, ImageDraw
+
+from toth.assets import get_asset_registry
+
+# Caminho da logo
+LOGO_PATH = "Terra_Cultural_sem_fundo.png"
+
+
+def int_to_roman(num):
+    val = [1000, 900, 500, 400,
+           100, 90, 50, 40,
+           10, 9, 5, 4,
+           1]
+    syms = ["M", "CM", "D", "CD",
+            "C", "XC", "L", "XL",
+            "X", "IX", "V", "IV",
+            "I"]
+    roman_num = ''
+    i = 0
+    while num > 0:
+        for _ in range(num // val[i]):
+            roman_num += syms[i]
+            num -= val[i]
+        i += 1
+    return roman_num
+
+# Fonte de cada estilo de numeração (as demais usam Roboto)
+STYLE_FONTS = {
+    "Romano": "EBGaramond-Regular.ttf",
+    "Fresco": "Pacifico-Regular.ttf",
+    "Moderno": "Montserrat-Regular.ttf",
+    "Elegante": "CormorantGaramond-Regular.ttf",
+    "Desenhado": "ButterflyKids-Regular.ttf",
+}
+
+# Cor padrão do número e espessura do contorno preto de cada estilo
+STYLE_COLORS = {
+    "Padrão": "#FFFFFF",
+    "Romano": "#FFFFFF",
+    "Fresco": "#FFD700",
+    "Moderno": "#007BFF",
+    "Elegante": "#8E44AD",
+    "Desenhado": "#FF69B4",
+}
+STYLE_OUTLINES = {
+    "Fresco": 2,
+    "Moderno": 0,
+}
+
+# Altura de referência da numeração: a fonte tem 1/45 dela e a margem, 2 cm a 96 dpi
+NUMBER_REFERENCE_HEIGHT = 2775  # pixels (altura de exportação do PDF com sangria)
+NUMBER_FONT_DIVISOR = 45
+NUMBER_MARGIN_PX = int(2 / 2.54 * 96)
+
+
+def style_font_path(style):
+    return os.path.join("fonts", STYLE_FONTS.get(style, "Roboto-Regular.ttf"))
+
+def asset_version(style=None, include_logo=False):
+    """Hash da fonte do estilo e da logo usadas, para as chaves dos caches de páginas e livros."""
+    registry = get_asset_registry()
+    return (registry.fingerprint(style_font_path(style)) if style is not None else None,
+            registry.fingerprint(LOGO_PATH) if include_logo else None)
+
+def number_text(display_number, style):
+    return int_to_roman(display_number) if style == "Romano" else str(display_number)
+
+def number_fill_color(style, custom_color=None):
+    return custom_color if custom_color else STYLE_COLORS.get(style, "#FFFFFF")
+
+def load_style_font(style, font_size):
+    return get_asset_registry().font(style_font_path(style), font_size)
+
+@lru_cache(maxsize=4096)
+def _text_bbox(style, font_size, text):
+    font = load_style_font(style, font_size)
+    return ImageDraw.Draw(Image.new("L", (1, 1))).textbbox((0, 0), text, font=font)
+
+@lru_cache(maxsize=4096)
+def render_number_stamp(style, text, fill_color, font_size, frac_x=0.0, frac_y=0.0, outline_range=None):
+    """Pré-renderiza o número (contorno + preenchimento) numa máscara RGBA.
+
+    Devolve a máscara e o deslocamento inteiro em relação ao ponto onde o texto seria
+    desenhado. `frac_x`/`frac_y` são a parte fracionária da posição, que o FreeType
+    usa no posicionamento subpixel dos glifos. `outline_range` substitui a espessura
+    do contorno do estilo (prévias reduzidas).
+
+    O contorno é acumulado numa máscara de cobertura e combinado com o preenchimento
+    por alpha_composite, que equivale a desenhar as camadas direto na página. A única
+    diferença para o desenho camada a camada é o arredondamento em 8 bits nas bordas
+    anti-serrilhadas: no máximo 2 níveis por canal, nunca no miolo dos glifos.
+    """
+    font = load_style_font(style, font_size)
+    if outline_range is None:
+        outline_range = STYLE_OUTLINES.get(style, 1)
+
+    measure = ImageDraw.Draw(Image.new("L", (1, 1)))
+    left, top, right, bottom = measure.textbbox((frac_x, frac_y), text, font=font)
+    pad = outline_range + 1
+    ox = math.floor(left) - pad
+    oy = math.floor(top) - pad
+    size = (math.ceil(right) + pad - ox, math.ceil(bottom) + pad - oy)
+    origin = (frac_x - ox, frac_y - oy)
+
+    fill_mask = Image.new("L", size, 0)
+    ImageDraw.Draw(fill_mask).text(origin, text, font=font, fill=255)
+    fill_layer = Image.new("RGBA", size, fill_color)
+    fill_layer.putalpha(fill_mask)
+
+    if outline_range <= 0:
+        return fill_layer, (ox, oy)
+
+    outline_mask = Image.new("L", size, 0)
+    outline_draw = ImageDraw.Draw(outline_mask)
+    for dx in range(-outline_range, outline_range + 1):
+        for dy in range(-outline_range, outline_range + 1):
+            outline_draw.text((origin[0] + dx, origin[1] + dy), text, font=font, fill=255)
+    outline_layer = Image.new("RGBA", size, "black")
+    outline_layer.putalpha(outline_mask)
+
+    return Image.alpha_composite(outline_layer, fill_layer), (ox, oy)
+
+# Fonte trocada no disco: medidas e números pré-renderizados deixam de valer
+get_asset_registry().on_invalidate(_text_bbox.cache_clear)
+get_asset_registry().on_invalidate(render_number_stamp.cache_clear)
+
+def add_page_number(image, display_number, alignment, style="Padrão", custom_color=None, scale=1.0):
+    """Desenha o número da página; `scale` é a razão entre `image` e a página real (prévia reduzida)."""
+    img = image.copy()
+    
+    # Utiliza uma altura padrão (ex.: altura de exportação do PDF com sangria)
+    font_size = max(1, int(NUMBER_REFERENCE_HEIGHT / NUMBER_FONT_DIVISOR * scale))
+
+    text = number_text(display_number, style)
+    fill_color = number_fill_color(style, custom_color)
+
+    # Posicionamento com base na largura real da imagem
+    width, height = img.size
+    bbox = _text_bbox(style, font_size, text)
+    text_width = bbox[2] - bbox[0]
+    text_height = bbox[3] - bbox[1]
+
+    margin = NUMBER_MARGIN_PX * scale  # 2 cm em pixels
+
+    if alignment == "Esquerda":
+        x = margin
+    elif alignment == "Direita":
+        x = width - text_width - margin
+    else:
+        available_width = width - 2 * margin
+        x = margin + (available_width - text_width) / 2
+
+    y = height - text_height - margin
+
+    # Uma única colagem por página no lugar de um draw.text por deslocamento do contorno
+    ix, iy = math.floor(x), math.floor(y)
+    # Em escala reduzida o contorno afina junto com a fonte (pode sumir)
+    outline_range = round(STYLE_OUTLINES.get(style, 1) * scale)
+    stamp, (ox, oy) = render_number_stamp(style, text, fill_color, font_size, x - ix, y - iy, outline_range)
+    img.paste(stamp, (ix + ox, iy + oy), stamp)
+    return img
+
+def add_logo_bottom_center(image, logo_path=LOGO_PATH, margin_bottom_cm=1.0, max_logo_width=200, scale=1.0):
+    # A logo vem do registro de arquivos, já redimensionada para esta escala
+    logo = get_asset_registry().logo(logo_path, max_logo_width, scale)
+    if logo is None:
+        return image 
+    img = image.copy()
+    new_w, new_h = logo.size
+
+    margin_px = int(margin_bottom_cm / 2.54 * 96 * scale)
+    x = (img.width - new_w) // 2
+    y = img.height - margin_px - new_h
+
+    if img.mode == "RGBA":
+        img.alpha_composite(logo, (x, y))
+    else:
+        img.paste(logo, (x, y), logo)
+    return img
+
+def fill_crop_box(size, target_w, target_h):
+    """Região da imagem que continua visível depois de ampliar/reduzir para cobrir o alvo e centralizar o corte."""
+    w, h = size
+    scale = max(target_w / w, target_h / h)
+    crop_w = target_w / scale
+    crop_h = target_h / scale
+    left = (w - crop_w) / 2
+    top = (h - crop_h) / 2
+    return (left, top, left + crop_w, top + crop_h)
+
+def resize_to_fill(img, target_w, target_h, reducing_gap=3.0):
+    """Mesmo enquadramento de scale_and_crop_to_fill, mas recortando antes de reamostrar.
+
+    Só a região visível passa pelo LANCZOS, e quando a origem é muito maior que o alvo
+    o Pillow reduz antes por média de blocos (reducing_gap). A diferença para
+    scale_and_crop_to_fill é de no máximo um pixel no enquadramento, porque o corte
+    aqui não é arredondado para pixels inteiros.
+    """
+    box = fill_crop_box(img.size, target_w, target_h)
+    return img.resize((target_w, target_h), resample=Image.LANCZOS, box=box, reducing_gap=reducing_gap)
+
+def open_for_fill(data, target_w, target_h):
+    """Abre uma página JPEG já reduzida pelo decodificador (1/2, 1/4 ou 1/8) quando ela é muito maior que o alvo."""
+    img = Image.open(io.BytesIO(data))
+    w, h = img.size
+    scale = max(target_w / w, target_h / h)
+    if scale < 1:
+        # O draft nunca reduz abaixo do tamanho pedido, então a imagem continua cobrindo o alvo
+        img.draft("RGB", (math.ceil(w * scale), math.ceil(h * scale)))
+    return img
+
+def scale_and_crop_to_fill(img, target_w, target_h):
+    w, h = img.size
+    ratio_img = w / h
+    ratio_target = target_w / target_h
+
+    if ratio_img > ratio_target:
+        new_height = target_h
+        scale = new_height / h
+        new_width = int(w * scale)
+        resized = img.resize((new_width, new_height), resample=Image.LANCZOS)
+        left = (new_width - target_w) // 2
+        final_img = resized.crop((left, 0, left + target_w, new_height))
+    else:
+        new_width = target_w
+        scale = new_width / w
+        new_height = int(h * scale)
+        resized = img.resize((new_width, new_height), resample=Image.LANCZOS)
+        top = (new_height - target_h) // 2
+        final_img = resized.crop((0, top, new_width, top + target_h))
+    return final_img
@@ -0,0 +1,117 @@
+"""Execução das gerações de livro em segundo plano.
+
+Os jobs rodam num pool de threads compartilhado pelo processo, fora do ciclo de
+execução do script do Streamlit. Cada job mantém o progresso por etapa e o
+resultado, então a interface pode consultá-lo a cada rerun, ou depois de uma
+reconexão, pelo identificador do job.
+"""
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_WORKERS = int(os.getenv("TOTH_JOB_WORKERS", "2"))
+# Por quanto tempo um job finalizado (e seu resultado) continua disponível
+JOB_TTL_SECONDS = int(os.getenv("TOTH_JOB_TTL_SECONDS", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id, meta=None):
+        self.id = job_id
+        self.meta = meta or {}
+        self.status = QUEUED
+        self.stages = {}
+        self.result = None
+        self.error = None
+        self.traceback = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._cancel = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def report(self, stage, done, total):
+        """Callback de progresso repassado ao pipeline; interrompe o job se ele foi cancelado."""
+        self.stages[stage] = (done, total)
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+
+class JobManager:
+    def __init__(self, max_workers=JOB_WORKERS, ttl=JOB_TTL_SECONDS):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="toth-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, meta=None, **kwargs):
+        """Agenda `fn(*args, progress=job.report, **kwargs)` e devolve o job."""
+        job = Job(uuid.uuid4().hex, meta)
+        with self._lock:
+            self._purge()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def _purge(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and now - job.finished_at > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _run(self, job, fn, args, kwargs):
+        if job._cancel.is_set():
+            self._finish(job, CANCELLED)
+            return
+        job.status = RUNNING
+        try:
+            job.result = fn(*args, progress=job.report, **kwargs)
+            status = DONE
+        except JobCancelled:
+            status = CANCELLED
+        except Exception as exc:
+            job.error = f"{type(exc).__name__}: {exc}"
+            job.traceback = traceback.format_exc()
+            status = FAILED
+        self._finish(job, status)
+
+    @staticmethod
+    def _finish(job, status):
+        # finished_at vem antes do status: um _purge concorrente pode ver o job finalizado
+        job.finished_at = time.time()
+        job.status = status
+
+
+_default_manager = None
+_manager_lock = threading.Lock()
+
+def get_job_manager():
+    """Pool de jobs único por processo, compartilhado entre sessões e reruns."""
+    global _default_manager
+    with _manager_lock:
+        if _default_manager is None:
+            _default_manager = JobManager()
+        return _default_manager
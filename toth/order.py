@@ -0,0 +1,109 @@
+"""Ordem das páginas do livro.
+
+Cada página recebe um identificador estável na chegada, que não muda quando outras
+páginas são movidas ou excluídas. A posição de uma página é consultada em tempo
+constante por um índice reconstruído apenas depois de cada alteração, e as
+alterações podem ser aplicadas em lote para que a interface recarregue uma única vez.
+"""
+
+
+class PageOrder:
+    def __init__(self, ids=()):
+        self._ids = list(ids)
+        if len(set(self._ids)) != len(self._ids):
+            raise ValueError("Identificadores de página repetidos")
+        self._next_id = max(self._ids, default=-1) + 1
+        self._positions = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(list(self._ids))
+
+    def __contains__(self, page_id):
+        return page_id in self._index()
+
+    @property
+    def ids(self):
+        return list(self._ids)
+
+    def _index(self):
+        if self._positions is None:
+            self._positions = {page_id: pos for pos, page_id in enumerate(self._ids)}
+        return self._positions
+
+    def _changed(self):
+        self._positions = None
+
+    def position(self, page_id):
+        """Posição da página, começando em 1."""
+        return self._index()[page_id] + 1
+
+    def add(self):
+        """Acrescenta uma página ao final e devolve seu identificador."""
+        page_id = self._next_id
+        self._next_id += 1
+        self._ids.append(page_id)
+        if self._positions is not None:
+            self._positions[page_id] = len(self._ids) - 1
+        return page_id
+
+    def move(self, page_id, new_position):
+        self.apply([("move", page_id, new_position)])
+
+    def remove(self, page_id):
+        self.apply([("delete", page_id)])
+
+    def apply(self, operations):
+        """Aplica uma lista de operações em sequência e devolve os ids excluídos.
+
+        Operações aceitas: ("move", id, nova_posição) e ("delete", id). As posições
+        de cada movimento são relativas à ordem resultante das operações anteriores.
+        """
+        ids = self._ids
+        deleted = []
+        for op in operations:
+            kind = op[0]
+            if kind == "move":
+                _, page_id, new_position = op
+                ids.remove(page_id)
+                ids.insert(max(0, min(new_position - 1, len(ids))), page_id)
+            elif kind == "delete":
+                ids.remove(op[1])
+                deleted.append(op[1])
+            else:
+                raise ValueError(f"Operação desconhecida: {kind}")
+        self._changed()
+        return deleted
+
+    def place(self, targets):
+        """Coloca várias páginas de uma vez nas posições pedidas ({id: posição}).
+
+        As demais páginas ocupam as posições livres mantendo a ordem relativa. Se duas
+        páginas pedirem a mesma posição, a segunda vai para a próxima posição livre
+        (ou para a anterior, no fim do livro).
+        """
+        total = len(self._ids)
+        slots = [None] * total
+        for page_id, new_position in sorted(targets.items(), key=lambda item: (item[1], self.position(item[0]))):
+            wanted = max(0, min(new_position - 1, total - 1))
+            free = [i for i in range(wanted, total) if slots[i] is None]
+            index = free[0] if free else max(i for i in range(wanted) if slots[i] is None)
+            slots[index] = page_id
+        others = iter(page_id for page_id in self._ids if page_id not in targets)
+        self.permute([page_id if page_id is not None else next(others) for page_id in slots])
+
+    def permute(self, ids):
+        """Substitui a ordem inteira por uma permutação das mesmas páginas."""
+        ids = list(ids)
+        if len(ids) != len(self._ids) or set(ids) != set(self._ids):
+            raise ValueError("A nova ordem precisa conter exatamente as mesmas páginas")
+        self._ids = ids
+        self._changed()
+
+    def sort_by(self, key, reverse=False):
+        self.permute(sorted(self._ids, key=key, reverse=reverse))
+
+    def reverse(self):
+        self.permute(reversed(self._ids))
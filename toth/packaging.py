@@ -0,0 +1,85 @@
+"""Empacotamento do livro num ZIP gravado direto em disco.
+
+Cada artefato (PDF, PDF com sangria, EPUB) é escrito no seu membro do ZIP à medida
+que é produzido, então nenhum deles precisa existir inteiro em memória. Os PDFs
+já são compostos de JPEGs e vão sem compressão; o EPUB é comprimido com deflate.
+
+Limitação: o st.download_button (Streamlit 1.44) lê o ZIP inteiro para a memória do
+servidor enquanto o botão estiver na página. O app só mostra o botão depois de
+"Preparar download" e o retira após o clique; o envio ao Drive lê do disco.
+"""
+import os
+import re
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager
+
+ARTIFACT_DIR = os.getenv("TOTH_ARTIFACT_DIR") or os.path.join(tempfile.gettempdir(), "toth_artifacts")
+# ZIPs gerados há mais tempo que isso são removidos do disco
+ARTIFACT_TTL_HOURS = float(os.getenv("TOTH_ARTIFACT_TTL_HOURS", "24"))
+# Caracteres que não podem aparecer num nome de arquivo (Windows) ou que criariam pastas
+_UNSAFE_FILENAME = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+
+def safe_filename(name, default="livro"):
+    """Nome do livro usável como nome de arquivo: sem separadores de pasta, "..", nem caracteres inválidos."""
+    name = _UNSAFE_FILENAME.sub("_", name).strip(" .")
+    return name or default
+
+
+class ZipSpool:
+    """ZIP gravado num arquivo temporário; o arquivo é removido se a geração falhar."""
+
+    def __init__(self, directory=ARTIFACT_DIR, suffix=".zip"):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=directory, prefix="livro-", suffix=suffix)
+        self._file = os.fdopen(fd, "w+b")
+        self._zip = zipfile.ZipFile(self._file, mode="w")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    @contextmanager
+    def member(self, name, compress_type=zipfile.ZIP_STORED):
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = compress_type
+        with self._zip.open(info, mode="w", force_zip64=True) as stream:
+            yield stream
+
+    def member_info(self, name):
+        """ZipInfo de um membro já gravado (file_size e compress_size)."""
+        return self._zip.getinfo(name)
+
+    def close(self):
+        self._zip.close()
+        self._file.close()
+
+    def discard(self):
+        try:
+            self._zip.close()
+        finally:
+            self._file.close()
+            os.remove(self.path)
+
+
+def prune_artifacts(directory=ARTIFACT_DIR, max_age_hours=ARTIFACT_TTL_HOURS):
+    if not os.path.isdir(directory):
+        return 0
+    removed = 0
+    cutoff = time.time() - max_age_hours * 3600
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
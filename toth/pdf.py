@@ -0,0 +1,350 @@
+"""Geração dos PDFs do livro.
+
+As páginas são gravadas como imagens JPEG embutidas diretamente no PDF (filtro
+DCTDecode), sem decodificar nem recomprimir os bytes recebidos. O arquivo é escrito
+de forma incremental: cada página vai para a saída assim que é adicionada e só a
+tabela de referências cruzadas fica para o final.
+
+No modo de numeração vetorial, o número da página é escrito como texto do PDF (com a
+fonte TrueType do estilo embutida, preenchimento e contorno) sobre a imagem intacta,
+então a página não precisa ser decodificada nem recomprimida para ser numerada.
+"""
+import io
+import re
+from functools import lru_cache
+
+from PIL import Image, ImageColor, ImageFont
+
+from toth.assets import get_asset_registry
+from toth.imaging import (
+    NUMBER_FONT_DIVISOR,
+    NUMBER_MARGIN_PX,
+    NUMBER_REFERENCE_HEIGHT,
+    STYLE_OUTLINES,
+    number_fill_color,
+    number_text,
+    open_for_fill,
+    resize_to_fill,
+    style_font_path,
+)
+from toth.print_profiles import DEFAULT_PRINT_DPI, DEFAULT_PRINT_PROFILE, bleed_page_size
+from toth.tracing import NULL_TRACE
+
+# Espaço de cores do PDF para cada modo de JPEG suportado
+_COLOR_SPACES = {
+    "L": "/DeviceGray",
+    "RGB": "/DeviceRGB",
+    "CMYK": "/DeviceCMYK",
+}
+
+
+def jpeg_info(data):
+    """Lê apenas o cabeçalho do JPEG e devolve (largura, altura, modo)."""
+    with Image.open(io.BytesIO(data)) as img:
+        if img.format != "JPEG":
+            raise ValueError(f"Página não está em JPEG: {img.format}")
+        return img.width, img.height, img.mode
+
+def can_embed_jpeg(data):
+    """Indica se os bytes podem ir direto para o PDF como a página final.
+
+    JPEGs CMYK ficam de fora: nem todos seguem a convenção Adobe de canais invertidos
+    e a conversão para RGB da renderização é a referência de cor.
+    """
+    try:
+        return jpeg_info(data)[2] in ("L", "RGB")
+    except (OSError, ValueError):
+        return False
+
+def _fmt(value):
+    return f"{value:.6f}".rstrip("0").rstrip(".")
+
+def _pdf_string(text):
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+@lru_cache(maxsize=None)
+def _font_program(style):
+    """Fonte TrueType do estilo e suas métricas em milésimos de em (unidade do PDF).
+
+    Devolve None se o arquivo da fonte não existir; o PDF usa então a Helvetica.
+    """
+    path = style_font_path(style)
+    data = get_asset_registry().read(path)
+    font = get_asset_registry().truetype(path, 1000)
+    if data is None or font is None:
+        return None
+    chars = [chr(code) for code in range(32, 127)]
+    ascent, descent = font.getmetrics()
+    boxes = [font.getbbox(ch, anchor="ls") for ch in chars if ch.strip()]
+    return {
+        "data": data,
+        "name": re.sub(r"[^A-Za-z0-9-]", "", "-".join(font.getname())) or "Font",
+        "widths": [round(font.getlength(ch)) for ch in chars],
+        "ascent": ascent,
+        "descent": descent,
+        # Caixa em coordenadas do PDF (y para cima)
+        "bbox": (min(b[0] for b in boxes), -max(b[3] for b in boxes),
+                 max(b[2] for b in boxes), -min(b[1] for b in boxes)),
+    }
+
+@lru_cache(maxsize=None)
+def _layout_font(style):
+    # Métricas para o posicionamento, na mesma fonte usada pela numeração rasterizada
+    return get_asset_registry().truetype(style_font_path(style), 1000) or ImageFont.load_default(size=1000)
+
+get_asset_registry().on_invalidate(_font_program.cache_clear)
+get_asset_registry().on_invalidate(_layout_font.cache_clear)
+
+def vector_numbers(total, num_start, num_end, initial_number, style, custom_color, alignment):
+    """Número de cada página (ou None) no formato aceito por JpegPdfWriter.add_jpeg_page."""
+    numbers = []
+    for pos in range(1, total + 1):
+        if num_start <= pos <= num_end:
+            numbers.append({
+                "text": number_text(initial_number + (pos - num_start), style),
+                "style": style,
+                "color": number_fill_color(style, custom_color),
+                "alignment": alignment,
+            })
+        else:
+            numbers.append(None)
+    return numbers
+
+
+class JpegPdfWriter:
+    """Escreve um PDF com uma imagem JPEG por página em `fp`, página a página."""
+
+    # 1 e 2 são reservados para o catálogo e a árvore de páginas, gravados no fechamento
+    _CATALOG_ID = 1
+    _PAGES_ID = 2
+
+    def __init__(self, fp, resolution=72.0):
+        self.fp = fp
+        self.resolution = resolution
+        self._position = 0
+        self._offsets = {}
+        self._page_ids = []
+        self._fonts = {}
+        self._next_id = 3
+        self._closed = False
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+    @property
+    def page_count(self):
+        return len(self._page_ids)
+
+    @property
+    def bytes_written(self):
+        return self._position
+
+    def _write(self, data):
+        self.fp.write(data)
+        self._position += len(data)
+
+    def _write_object(self, obj_id, header, stream=None):
+        self._offsets[obj_id] = self._position
+        self._write(f"{obj_id} 0 obj\n".encode("ascii"))
+        self._write(header.encode("ascii"))
+        if stream is not None:
+            self._write(b"\nstream\n")
+            self._write(stream)
+            self._write(b"\nendstream")
+        self._write(b"\nendobj\n")
+
+    def _allocate_ids(self, count):
+        first = self._next_id
+        self._next_id += count
+        return range(first, first + count)
+
+    def _font_resource(self, style):
+        """Grava (uma vez por PDF) a fonte do estilo e devolve o id do objeto /Font."""
+        if style in self._fonts:
+            return self._fonts[style]
+        program = _font_program(style)
+        if program is None:
+            (font_id,) = self._allocate_ids(1)
+            self._write_object(font_id, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        else:
+            file_id, descriptor_id, font_id = self._allocate_ids(3)
+            data = program["data"]
+            self._write_object(file_id, f"<< /Length {len(data)} /Length1 {len(data)} >>", data)
+            bbox = " ".join(str(v) for v in program["bbox"])
+            self._write_object(
+                descriptor_id,
+                f"<< /Type /FontDescriptor /FontName /{program['name']} /Flags 32 /FontBBox [{bbox}]"
+                f" /ItalicAngle 0 /Ascent {program['ascent']} /Descent {-program['descent']}"
+                f" /CapHeight {program['ascent']} /StemV 80 /FontFile2 {file_id} 0 R >>",
+            )
+            widths = " ".join(str(w) for w in program["widths"])
+            self._write_object(
+                font_id,
+                f"<< /Type /Font /Subtype /TrueType /BaseFont /{program['name']} /FirstChar 32 /LastChar 126"
+                f" /Widths [{widths}] /FontDescriptor {descriptor_id} 0 R /Encoding /WinAnsiEncoding >>",
+            )
+        self._fonts[style] = font_id
+        return font_id
+
+    def _number_operators(self, number, page_w, page_h):
+        """Operadores que desenham o número com a mesma geometria de add_page_number.
+
+        Tamanho da fonte, margem e contorno são proporcionais à altura real da página
+        (no modo rasterizado eles são fixos para uma página de 2775 px).
+        """
+        style = number["style"]
+        font = _layout_font(style)
+        text = number["text"]
+        px = page_h / NUMBER_REFERENCE_HEIGHT  # pontos por pixel de referência
+        font_size = page_h / NUMBER_FONT_DIVISOR
+        k = font_size / 1000
+        margin = NUMBER_MARGIN_PX * px
+
+        left, top, right, bottom = font.getbbox(text)
+        text_width = (right - left) * k
+        text_height = (bottom - top) * k
+        ascent = font.getmetrics()[0] * k
+
+        if number["alignment"] == "Esquerda":
+            x = margin
+        elif number["alignment"] == "Direita":
+            x = page_w - text_width - margin
+        else:
+            x = margin + (page_w - 2 * margin - text_width) / 2
+        # add_page_number posiciona o topo da linha (ascendente); o PDF posiciona a linha de base
+        y = text_height + margin - ascent
+
+        red, green, blue = (c / 255 for c in ImageColor.getrgb(number["color"])[:3])
+        head = f"BT /Fnum {_fmt(font_size)} Tf {_fmt(x)} {_fmt(y)} Td "
+        ops = []
+        outline_range = STYLE_OUTLINES.get(style, 1)
+        if outline_range > 0:
+            # Traço centrado no contorno do glifo, pintado antes do preenchimento: a metade de dentro
+            # fica coberta e a de fora forma o contorno, como no rasterizado. Marcado como artefato
+            # (o catálogo declara /MarkInfo) para que a extração de texto leia o número uma vez só
+            ops.append("/Artifact BMC " + head + f"1 j {_fmt(2 * outline_range * px)} w 0 0 0 RG 1 Tr {_pdf_string(text)} Tj ET EMC")
+        ops.append(head + f"{_fmt(red)} {_fmt(green)} {_fmt(blue)} rg 0 Tr {_pdf_string(text)} Tj ET")
+        return " ".join(ops)
+
+    def add_jpeg_page(self, data, resolution=None, number=None):
+        """Adiciona uma página com o JPEG `data`; `number` (ver vector_numbers) escreve o número como texto."""
+        width, height, mode = jpeg_info(data)
+        if mode not in _COLOR_SPACES:
+            raise ValueError(f"Modo de JPEG não suportado no PDF: {mode}")
+        resolution = resolution or self.resolution
+        page_w = width * 72.0 / resolution
+        page_h = height * 72.0 / resolution
+
+        font_id = self._font_resource(number["style"]) if number is not None else None
+        image_id, content_id, page_id = self._allocate_ids(3)
+
+        # JPEGs CMYK gravados pelo Photoshop/Pillow vêm com os canais invertidos (Adobe)
+        decode = " /Decode [1 0 1 0 1 0 1 0]" if mode == "CMYK" else ""
+        self._write_object(
+            image_id,
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height}"
+            f" /ColorSpace {_COLOR_SPACES[mode]} /BitsPerComponent 8{decode}"
+            f" /Filter /DCTDecode /Length {len(data)} >>",
+            data,
+        )
+        content = f"q {_fmt(page_w)} 0 0 {_fmt(page_h)} 0 0 cm /image Do Q"
+        fonts = ""
+        if number is not None:
+            content += " " + self._number_operators(number, page_w, page_h)
+            fonts = f" /Font << /Fnum {font_id} 0 R >>"
+        content = content.encode("ascii")
+        self._write_object(content_id, f"<< /Length {len(content)} >>", content)
+        self._write_object(
+            page_id,
+            f"<< /Type /Page /Parent {self._PAGES_ID} 0 R"
+            f" /Resources << /ProcSet [/PDF /Text /ImageB /ImageC] /XObject << /image {image_id} 0 R >>{fonts} >>"
+            f" /MediaBox [0 0 {_fmt(page_w)} {_fmt(page_h)}] /Contents {content_id} 0 R >>",
+        )
+        self._page_ids.append(page_id)
+
+    def add_image_page(self, img, resolution=None, number=None):
+        # Mesma codificação que o Image.save(format="PDF") usava para páginas RGB
+        if img.mode not in _COLOR_SPACES:
+            img = img.convert("RGB")
+        with io.BytesIO() as output:
+            img.save(output, format="JPEG")
+            self.add_jpeg_page(output.getvalue(), resolution=resolution, number=number)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._write_object(self._PAGES_ID, f"<< /Type /Pages /Count {len(self._page_ids)} /Kids [{kids}] >>")
+        # Com numeração vetorial, o contorno é marcado como artefato: o documento declara o conteúdo marcado
+        marked = " /MarkInfo << /Marked true >>" if self._fonts else ""
+        self._write_object(self._CATALOG_ID, f"<< /Type /Catalog /Pages {self._PAGES_ID} 0 R{marked} >>")
+
+        xref_offset = self._position
+        lines = [f"xref\n0 {self._next_id}\n", "0000000000 65535 f \n"]
+        for obj_id in range(1, self._next_id):
+            lines.append(f"{self._offsets[obj_id]:010d} 00000 n \n")
+        lines.append(f"trailer\n<< /Size {self._next_id} /Root {self._CATALOG_ID} 0 R >>\n")
+        lines.append(f"startxref\n{xref_offset}\n%%EOF\n")
+        self._write("".join(lines).encode("ascii"))
+
+
+def generate_pdf(pages, resolution=72.0, output=None, numbers=None):
+    """Monta o PDF a partir dos bytes JPEG de cada página, sem recomprimi-los.
+
+    Se `output` for informado, o PDF é gravado nele à medida que é gerado (basta ter
+    write(), como um membro de ZIP aberto para escrita); senão, devolve um BytesIO.
+    `numbers` (de vector_numbers) escreve a numeração como texto vetorial.
+    """
+    pdf_bytes = io.BytesIO() if output is None else output
+    if pages:
+        numbers = numbers or [None] * len(pages)
+        with JpegPdfWriter(pdf_bytes, resolution=resolution) as writer:
+            for data, number in zip(pages, numbers):
+                writer.add_jpeg_page(data, number=number)
+    if output is None:
+        pdf_bytes.seek(0)
+    return pdf_bytes
+
+def add_sangria_page(writer, img, target_w, target_h, number=None, trace=None):
+    """Enquadra uma página (PIL ou bytes JPEG) no tamanho com sangria e a grava em `writer`."""
+    trace = trace or NULL_TRACE
+    with trace.span("sangria.decode", bytes_in=len(img) if isinstance(img, (bytes, bytearray)) else 0):
+        if isinstance(img, (bytes, bytearray)):
+            img = open_for_fill(img, target_w, target_h)
+        # Páginas mapeadas de toth.pixels (RGBX) são reamostradas direto, sem cópia em RGB
+        if img.mode not in ("RGB", "RGBX"):
+            img = img.convert("RGB")
+        img.load()
+    with trace.span("sangria.resize"):
+        filled_img = resize_to_fill(img, target_w, target_h)
+    with trace.span("sangria.encode") as stats:
+        start = writer.bytes_written
+        writer.add_image_page(filled_img, number=number)
+        stats.bytes_out += writer.bytes_written - start
+
+def generate_pdf_sangria(images, dpi=DEFAULT_PRINT_DPI, output=None, profile=DEFAULT_PRINT_PROFILE, numbers=None,
+                         trace=None):
+    """PDF com sangria no formato de impressão `profile` (6 x 9 pol. a 300 dpi: 1838 x 2775 px).
+
+    Cada página pode vir já decodificada (PIL) ou como bytes JPEG; nesse caso ela é
+    decodificada direto em escala reduzida quando for bem maior que a página final.
+    Com `trace`, decodificação, redimensionamento e codificação são medidos por página.
+    """
+    target_w, target_h = bleed_page_size(profile, dpi)
+
+    pdf_bytes = io.BytesIO() if output is None else output
+    if images:
+        with JpegPdfWriter(pdf_bytes, resolution=dpi) as writer:
+            # Cada página é redimensionada e gravada antes da próxima, sem acumular a lista inteira
+            numbers = numbers or [None] * len(images)
+            for img, number in zip(images, numbers):
+                add_sangria_page(writer, img, target_w, target_h, number=number, trace=trace)
+    if output is None:
+        pdf_bytes.seek(0)
+    return pdf_bytes
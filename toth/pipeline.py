@@ -0,0 +1,502 @@
+"""Pipeline completo de geração do livro: páginas, PDFs, EPUB e ZIP final.
+
+Recebe as páginas já na ordem final e o dicionário de configuração montado pela
+interface (o mesmo usado no config_hash), sem depender do Streamlit. Cada etapa é
+medida num Trace (ver toth.tracing), cujo resumo vai junto com o resultado.
+
+Com TOTH_MEMORY_LIMIT_MB (ou "memory_limit_mb" na configuração), a geração passa as
+páginas em janelas que cabem no limite e grava os intermediários em disco, então o
+pico de memória não cresce com o número de páginas.
+
+Depois das páginas, os arquivos do livro (PDF, PDF com sangria, EPUB) são gravados
+ao mesmo tempo, todos lendo a mesma PageSource somente leitura; "outputs" na
+configuração escolhe quais deles gerar (ex.: só o PDF com sangria para a gráfica).
+
+Os módulos de imagem (Pillow, renderização, PDF) só são importados na primeira
+geração; a interface importa este módulo apenas pelas etapas e opções.
+"""
+import io
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from collections.abc import Sequence
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+
+from toth.artifacts import book_key, get_artifact_cache
+from toth.epub import DEFAULT_EPUB_PROFILE, generate_epub
+from toth.jobs import JobCancelled
+from toth.packaging import ZipSpool, prune_artifacts, safe_filename
+from toth.pixels import get_pixel_store
+from toth.print_profiles import DEFAULT_PRINT_DPI, DEFAULT_PRINT_PROFILE
+from toth.tracing import Trace
+
+# Modos de numeração: desenhada nos pixels da página ou escrita como texto no PDF
+NUMBER_MODES = {
+    "raster": "Na imagem",
+    "vector": "Vetorial (texto do PDF)",
+}
+DEFAULT_NUMBER_MODE = "raster"
+
+# Memória máxima (MB) das páginas decodificadas durante a geração; 0 mantém tudo em
+# memória. Com limite, as páginas passam em janelas e os intermediários vão para o disco
+MEMORY_LIMIT_MB = int(os.getenv("TOTH_MEMORY_LIMIT_MB", "0"))
+SPILL_DIR = os.getenv("TOTH_SPILL_DIR") or None
+
+# Arquivos que o livro pode conter; "outputs" na configuração escolhe um subconjunto
+OUTPUTS = {
+    "pdf": "PDF",
+    "sangria": "PDF com sangria (gráfica)",
+    "epub": "EPUB",
+}
+# Como os arquivos são gravados depois das páginas: threads (o Pillow libera o GIL ao
+# codificar e redimensionar), processos ou um após o outro ("serial")
+WRITER_BACKEND = os.getenv("TOTH_WRITER_BACKEND", "thread")
+# Intervalo (s) em que a gravação dos arquivos confere se o job foi cancelado
+CANCEL_POLL_SECONDS = 0.5
+
+# Etapas reportadas ao callback de progresso, na ordem em que acontecem
+STAGES = (
+    ("pages", "Páginas renderizadas"),
+    ("pdf", "PDF gravado"),
+    ("sangria", "PDF com sangria gravado"),
+    ("epub", "EPUB gravado"),
+    ("zip", "ZIP concluído"),
+)
+
+
+def _no_progress(stage, done, total):
+    pass
+
+def book_outputs(config):
+    """Arquivos pedidos em config["outputs"] (todos, se ausente), na ordem de OUTPUTS."""
+    requested = config.get("outputs") or tuple(OUTPUTS)
+    unknown = set(requested) - set(OUTPUTS)
+    if unknown:
+        raise ValueError(f"Arquivo de saída desconhecido: {', '.join(sorted(unknown))}")
+    return tuple(output for output in OUTPUTS if output in requested)
+
+def generate_book(files, config, progress=None):
+    """Gera o ZIP do livro em disco e devolve {"zip_path", "zip_filename", "trace"}.
+
+    `progress(etapa, feitas, total)` é chamado ao longo da geração; se ele levantar
+    uma exceção, a geração é interrompida no ponto em que estiver. "trace" é o resumo
+    das medições por etapa (Trace.summary()).
+    """
+    trace = Trace("generation", book=config["book_name"], pages=len(files))
+    try:
+        result = _generate_book(files, config, progress or _no_progress, trace)
+    except JobCancelled:
+        trace.finish("cancelled")
+        raise
+    except BaseException:
+        trace.finish("failed")
+        raise
+    result["trace"] = trace.finish("ok")
+    return result
+
+def generate_book_cached(files, config, progress=None, cache=None):
+    """Como generate_book, mas reaproveita o livro do cache compartilhado (toth.artifacts).
+
+    O resultado traz também "cache_key" e "cached" (True se o ZIP veio do cache; nesse
+    caso "trace" é o da geração original).
+    """
+    cache = cache or get_artifact_cache()
+    key = book_key(files, config)
+    entry = cache.get(key)
+    cached = entry is not None
+    if cached:
+        report = progress or _no_progress
+        outputs = book_outputs(config)
+        for stage, _ in STAGES:
+            if stage not in OUTPUTS or stage in outputs:
+                report(stage, 1, 1)
+    else:
+        result = generate_book(files, config, progress=progress)
+        entry = cache.put(key, result["zip_path"], result["zip_filename"], trace=result["trace"])
+    return {"zip_path": entry["zip_path"], "zip_filename": entry["zip_filename"], "trace": entry["trace"],
+            "cache_key": key, "cached": cached}
+
+class PageSource(Sequence):
+    """Páginas renderizadas do livro, na ordem, somente leitura: cada item é o JPEG da página.
+
+    É a entrada comum dos escritores. Em memória (threads), guarda os bytes e as imagens
+    já decodificadas; com `paths` (processos, memória limitada) guarda só os caminhos dos
+    JPEGs e lê cada um quando pedido, então nenhuma página é copiada entre processos.
+    """
+
+    def __init__(self, names, data=None, images=None, paths=None, prefer_images=False, stop=None):
+        self.names = names
+        self._data = data
+        self._images = images
+        self._paths = paths
+        self._prefer_images = prefer_images
+        # threading.Event (ou outro sinal com is_set()): quando ligado, a próxima página
+        # pedida interrompe o escritor
+        self._stop = stop
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        self._check_stop()
+        if self._prefer_images and self._images is not None and self._images[index] is not None:
+            return self._images[index]
+        if self._data is not None:
+            return self._data[index]
+        with open(self._paths[index], "rb") as fh:
+            return fh.read()
+
+    @property
+    def nbytes(self):
+        if self._data is not None:
+            return sum(len(data) for data in self._data)
+        return sum(os.path.getsize(path) for path in self._paths)
+
+    def decoded(self):
+        """A mesma fonte, mas devolvendo a imagem decodificada das páginas que a tiverem (PDF com sangria)."""
+        return PageSource(self.names, self._data, self._images, self._paths, prefer_images=True, stop=self._stop)
+
+    def stoppable(self, stop):
+        """A mesma fonte, interrompida (JobCancelled) assim que `stop` for ligado."""
+        return PageSource(self.names, self._data, self._images, self._paths, self._prefer_images, stop)
+
+    def epub_files(self):
+        """As páginas no formato de generate_epub, entregues uma a uma e interrompidas como as demais."""
+        return _EpubFiles(self)
+
+    def epub_file(self, index):
+        self._check_stop()
+        if self._data is not None:
+            return {"name": self.names[index], "data": self._data[index]}
+        return {"name": self.names[index], "path": self._paths[index]}
+
+    def _check_stop(self):
+        if self._stop is not None and self._stop.is_set():
+            raise JobCancelled()
+
+    def spill(self, directory):
+        """Grava os JPEGs em `directory` e devolve uma fonte que só guarda os caminhos."""
+        if self._data is None:
+            return self
+        paths = []
+        for position, data in enumerate(self._data, 1):
+            path = os.path.join(directory, f"page_{position:05d}.jpg")
+            with open(path, "wb") as fh:
+                fh.write(data)
+            paths.append(path)
+        return PageSource(self.names, paths=paths)
+
+class _EpubFiles(Sequence):
+    """Visão de uma PageSource com um dicionário por página ({"name", "data" ou "path"})."""
+
+    def __init__(self, source):
+        self._source = source
+
+    def __len__(self):
+        return len(self._source)
+
+    def __getitem__(self, index):
+        return self._source.epub_file(index)
+
+class _StopFile:
+    """Sinal de parada (como threading.Event) visível por processos: um arquivo no disco."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def set(self):
+        open(self.path, "wb").close()
+
+    def is_set(self):
+        return os.path.exists(self.path)
+
+class _ReportStop:
+    """Sinal de parada de uma gravação sem workers: o próprio progresso confere o cancelamento.
+
+    Reportar o arquivo em andamento levanta JobCancelled se o job foi cancelado.
+    """
+
+    def __init__(self, report, output):
+        self._report = report
+        self._output = output
+
+    def is_set(self):
+        self._report(self._output, 0, 1)
+        return False
+
+def _generate_book(files, config, report, trace):
+    from toth.pdf import vector_numbers
+    from toth.render import build_page_jobs
+
+    # O nome vira nome de arquivo (ZIP, membros, temporários): sem pastas nem caracteres inválidos
+    book_name = safe_filename(config["book_name"])
+    outputs = book_outputs(config)
+
+    vector = config.get("number_mode", DEFAULT_NUMBER_MODE) == "vector"
+    numbers = None
+    if vector:
+        numbers = vector_numbers(
+            len(files),
+            config["num_start"],
+            config["num_end"],
+            config["initial_number"],
+            config["number_style"],
+            config["custom_color"],
+            config["alignment"]
+        )
+
+    jobs = build_page_jobs(
+        files,
+        config["num_start"],
+        config["num_end"],
+        config["initial_number"],
+        config["alignment"],
+        config["number_style"],
+        custom_color=config["custom_color"],
+        include_logo=config["include_logo"],
+        burn_numbers=not vector
+    )
+
+    names = {
+        "pdf": f"{book_name}.pdf",
+        "sangria": f"{book_name}_sangria.pdf",
+        "epub": "livro.epub",
+    }
+    memory_limit_mb = config.get("memory_limit_mb", MEMORY_LIMIT_MB)
+
+    prune_artifacts()
+    # As páginas normalizadas do livro não são removidas do disco enquanto ele é gerado.
+    # Os arquivos são gravados em `spill_dir` e copiados para o ZIP em disco ao ficarem prontos
+    with get_pixel_store().pinned(job["sha256"] for job in jobs), ZipSpool() as spool:
+        with tempfile.TemporaryDirectory(prefix="toth-spill-", dir=SPILL_DIR) as spill_dir:
+            if memory_limit_mb:
+                _write_windowed(spool, names, outputs, files, jobs, numbers, config, report, trace,
+                                memory_limit_mb * 1024 * 1024, spill_dir)
+            else:
+                _write_in_memory(spool, names, outputs, files, jobs, numbers, config, report, trace, spill_dir)
+
+        report("zip", 0, 1)
+        # Fechar o spool grava o diretório central do ZIP
+        with trace.span("zip") as zip_stats:
+            spool.close()
+        zip_stats.bytes_out += os.path.getsize(spool.path)
+    report("zip", 1, 1)
+
+    return {"zip_path": spool.path, "zip_filename": f"{book_name}.zip"}
+
+def _write_output(output, path, source, config, numbers, spill_dir=None, trace=None):
+    """Grava um arquivo do livro (`output`, de OUTPUTS) em `path` a partir de `source`.
+
+    Roda numa thread ou num processo à parte. Sem `trace` (processos), as medições são
+    feitas num Trace local e devolvidas para o processo principal somá-las.
+    """
+    from toth.pdf import generate_pdf, generate_pdf_sangria
+
+    local_trace = Trace(output) if trace is None else None
+    trace = trace or local_trace
+    with trace.span(output, bytes_in=source.nbytes if output != "sangria" else 0) as stats:
+        with open(path, "wb") as output_file:
+            if output == "pdf":
+                generate_pdf(source, output=output_file, numbers=numbers)
+            elif output == "sangria":
+                generate_pdf_sangria(
+                    source.decoded(),
+                    dpi=config.get("print_dpi", DEFAULT_PRINT_DPI),
+                    output=output_file,
+                    profile=config.get("print_profile", DEFAULT_PRINT_PROFILE),
+                    numbers=numbers,
+                    trace=trace
+                )
+            else:
+                generate_epub(
+                    source.epub_files(),
+                    config["num_start"],
+                    config["num_end"],
+                    config["initial_number"],
+                    config["alignment"],
+                    config["number_style"],
+                    custom_color=config["custom_color"],
+                    add_numbering=config["include_epub_numbering"],
+                    output=output_file,
+                    profile=config.get("epub_profile", DEFAULT_EPUB_PROFILE),
+                    spill_dir=spill_dir
+                )
+        stats.bytes_out += os.path.getsize(path)
+    return None if local_trace is None else local_trace.summary()["stages"]
+
+def _write_outputs(outputs, paths, source, config, numbers, report, trace, epub_spill_dir=None):
+    """Grava os arquivos pedidos ao mesmo tempo, um worker por arquivo, com o backend configurado."""
+    backend = config.get("writer_backend") or WRITER_BACKEND
+    if backend not in ("process", "thread", "serial"):
+        raise ValueError(f"Backend de gravação desconhecido: {backend}")
+    for output in outputs:
+        report(output, 0, 1)
+
+    if backend == "serial" or len(outputs) == 1:
+        for output in outputs:
+            _write_output(output, paths[output], source.stoppable(_ReportStop(report, output)), config, numbers,
+                          epub_spill_dir, trace)
+            report(output, 1, 1)
+        return
+
+    if backend == "process":
+        from toth.render import PROCESS_CONTEXT
+
+        # Os processos recebem só os caminhos dos JPEGs, gravados uma vez ao lado dos arquivos.
+        # Um threading.Event não chega a eles: a parada é um arquivo na mesma pasta
+        directory = os.path.dirname(paths[outputs[0]])
+        stop = _StopFile(os.path.join(directory, "toth-stop"))
+        source = source.spill(directory).stoppable(stop)
+        executor = ProcessPoolExecutor(max_workers=len(outputs), mp_context=PROCESS_CONTEXT)
+        worker_trace = None
+    else:
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=len(outputs), thread_name_prefix="toth-writer")
+        worker_trace = trace
+        source = source.stoppable(stop)
+    try:
+        futures = {
+            executor.submit(_write_output, output, paths[output], source, config, numbers,
+                            epub_spill_dir, worker_trace): output
+            for output in outputs
+        }
+        pending = set(futures)
+        while pending:
+            finished, pending = wait(pending, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in finished:
+                for stage in future.result() or ():
+                    trace.add(stage["stage"], stage["duration_s"], stage["bytes_in"], stage["bytes_out"], stage["calls"])
+                report(futures[future], 1, 1)
+            # Reportar os arquivos ainda em andamento confere se o job foi cancelado
+            for future in pending:
+                report(futures[future], 0, 1)
+    except BaseException:
+        # Erro ou cancelamento: interrompe os demais arquivos e espera os que já estão
+        # gravando, antes que o diretório temporário deles seja apagado
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+def _copy_outputs(spool, names, outputs, paths, trace):
+    # O ZIP aceita um membro aberto por vez: os arquivos prontos são copiados em sequência.
+    # Os PDFs são JPEG e vão sem compressão; o EPUB é comprimido com deflate
+    for output in outputs:
+        compress_type = zipfile.ZIP_DEFLATED if output == "epub" else zipfile.ZIP_STORED
+        with trace.span("zip"):
+            with open(paths[output], "rb") as src, spool.member(names[output], compress_type) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.remove(paths[output])
+
+def _write_in_memory(spool, names, outputs, files, jobs, numbers, config, report, trace, spill_dir):
+    from toth.render import render_pages
+
+    page_data = [None] * len(files)
+    images = [None] * len(files)
+    with trace.span("pages") as pages_stats:
+        pages = render_pages(jobs, progress=lambda done, total: report("pages", done, total))
+    for rendered in pages:
+        page_data[rendered["position"] - 1] = rendered["data"]
+        # Páginas não modificadas (e todas, quando renderizadas em processos) chegam sem a
+        # imagem decodificada; o PDF com sangria usa o JPEG
+        images[rendered["position"] - 1] = rendered["image"]
+        _record_page(trace, pages_stats, rendered)
+
+    source = PageSource([f["name"] for f in files], data=page_data, images=images)
+    paths = {output: os.path.join(spill_dir, names[output]) for output in outputs}
+    _write_outputs(outputs, paths, source, config, numbers, report, trace)
+    _copy_outputs(spool, names, outputs, paths, trace)
+
+def _record_page(trace, pages_stats, rendered):
+    # Passos medidos dentro dos workers (soma entre workers); páginas do cache não têm "timings"
+    for step, seconds in rendered.get("timings", {}).items():
+        trace.add(f"pages.{step}", seconds)
+    pages_stats.bytes_in += rendered.get("bytes_in", 0)
+    pages_stats.bytes_out += len(rendered["data"])
+
+def _page_windows(jobs, limit_bytes, reserved_bytes):
+    """Agrupa as páginas (na ordem) em janelas cujas imagens decodificadas cabem no limite."""
+    from PIL import Image
+
+    window, used = [], reserved_bytes
+    for job in jobs:
+        source = job["source"]
+        with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as img:
+            # Imagem RGB decodificada mais o JPEG renderizado, com folga
+            cost = img.width * img.height * 4
+        if window and used + cost > limit_bytes:
+            yield window
+            window, used = [], reserved_bytes
+        window.append(job)
+        used += cost
+    if window:
+        yield window
+
+def _write_windowed(spool, names, outputs, files, jobs, numbers, config, report, trace, limit_bytes, spill_dir):
+    """Geração com memória limitada: as páginas passam em janelas pelos dois PDFs.
+
+    Cada janela é renderizada, gravada nos PDFs (em arquivos temporários, já que o ZIP
+    só aceita um membro aberto por vez) e descartada; o JPEG de cada página vai para
+    `spill_dir` e o EPUB é montado a partir do disco. O cache de páginas não é usado,
+    para não reter imagens decodificadas entre gerações.
+    """
+    from toth.pdf import JpegPdfWriter, add_sangria_page
+    from toth.print_profiles import bleed_page_size
+    from toth.render import render_pages
+
+    dpi = config.get("print_dpi", DEFAULT_PRINT_DPI)
+    target_w, target_h = bleed_page_size(config.get("print_profile", DEFAULT_PRINT_PROFILE), dpi)
+    # A página com sangria (e a cópia redimensionada) existe uma de cada vez
+    reserved = target_w * target_h * 3 * 2 if "sangria" in outputs else 0
+    total = len(jobs)
+    done = 0
+    page_paths = []
+    paths = {output: os.path.join(spill_dir, names[output]) for output in outputs}
+
+    with trace.span("pages") as pages_stats, ExitStack() as stack:
+        pdf_writer = sangria_writer = None
+        if "pdf" in outputs:
+            pdf_writer = stack.enter_context(JpegPdfWriter(stack.enter_context(open(paths["pdf"], "wb"))))
+        if "sangria" in outputs:
+            sangria_writer = stack.enter_context(
+                JpegPdfWriter(stack.enter_context(open(paths["sangria"], "wb")), resolution=dpi))
+        report("pages", 0, total)
+        for window in _page_windows(jobs, limit_bytes, reserved):
+            offset = done
+            rendered_window = render_pages(
+                window, cache=None,
+                progress=lambda window_done, _: report("pages", offset + window_done, total)
+            )
+            for rendered in rendered_window:
+                position = rendered["position"]
+                number = numbers[position - 1] if numbers else None
+                _record_page(trace, pages_stats, rendered)
+                if pdf_writer is not None:
+                    with trace.span("pdf"):
+                        pdf_writer.add_jpeg_page(rendered["data"], number=number)
+                if sangria_writer is not None:
+                    add_sangria_page(sangria_writer, rendered["image"] if rendered["image"] is not None else rendered["data"],
+                                     target_w, target_h, number=number, trace=trace)
+
+                if "epub" in outputs:
+                    page_path = os.path.join(spill_dir, f"page_{position:05d}.jpg")
+                    with open(page_path, "wb") as fh:
+                        fh.write(rendered["data"])
+                    page_paths.append(page_path)
+            done += len(window)
+            for output in ("pdf", "sangria"):
+                if output in outputs:
+                    report(output, done, total)
+            # Libera as imagens da janela antes de renderizar a próxima
+            del rendered_window, rendered
+
+    for output in ("pdf", "sangria"):
+        if output in outputs:
+            trace.stats(output).bytes_out += os.path.getsize(paths[output])
+    if "epub" in outputs:
+        source = PageSource([f["name"] for f in files], paths=page_paths)
+        _write_outputs(("epub",), paths, source, config, numbers, report, trace, epub_spill_dir=spill_dir)
+    _copy_outputs(spool, names, outputs, paths, trace)
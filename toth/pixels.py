@@ -0,0 +1,263 @@
+"""Páginas já decodificadas e normalizadas, em disco, para mapear direto na memória.
+
+Cada página é decodificada e normalizada uma única vez (no upload, em segundo plano,
+ou na primeira renderização):
+- a orientação EXIF é aplicada aos pixels;
+- paleta, CMYK, tons de cinza e 16 bits viram RGB de 8 bits;
+- páginas com mais de MAX_PAGE_PIXELS são reduzidas, mantendo a proporção.
+
+Os pixels ficam num arquivo cru endereçado pelo SHA-256 da imagem original. O
+formato é RGBX (4 bytes por pixel), porque o Pillow só mapeia sem cópia modos de
+4 bytes, e RGB já é guardado assim na memória. A renderização abre a página com
+Image.frombuffer sobre um mmap do arquivo, sem decodificar nem copiar. A imagem é
+somente leitura; a numeração e a logo já trabalham sobre uma cópia.
+
+O diretório é limitado pelo tamanho total: acima dele saem as páginas usadas há mais
+tempo, até PRUNE_TARGET do limite, exceto as protegidas por pinned() (as do livro em
+geração). O processo soma o que grava e só varre o diretório quando a soma passa do
+limite; render_pages varre uma vez ao fim de cada lote, o que também conta o que os
+workers e outros processos gravaram. Vários processos podem compartilhar o mesmo
+diretório.
+"""
+import io
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+PIXEL_DIR = os.getenv("TOTH_PIXEL_DIR") or os.path.join(tempfile.gettempdir(), "toth_pixels")
+PIXEL_CACHE_MB = int(os.getenv("TOTH_PIXEL_CACHE_MB", "8192"))
+# Páginas maiores que isso são reduzidas na normalização (0 desliga); 40 MP cobre A4 a 600 dpi
+MAX_PAGE_PIXELS = int(os.getenv("TOTH_MAX_PAGE_PIXELS", "40000000"))
+# Acima do limite, a remoção desce até esta fração dele, para não varrer o diretório a cada página
+PRUNE_TARGET = 0.9
+
+_EXIF_ORIENTATION = 0x0112
+_HEADER = struct.Struct("<8sII")
+_MAGIC = b"TOTHRGBX"
+_SIXTEEN_BIT_MODES = ("I;16", "I;16B", "I;16L", "I;16N", "I")
+
+
+def is_rotated(data):
+    """Indica se a imagem tem orientação EXIF diferente da normal (só lê o cabeçalho)."""
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return img.getexif().get(_EXIF_ORIENTATION, 1) != 1
+    except OSError:
+        return False
+
+def exif_transpose(img):
+    """Gira/espelha os pixels conforme a orientação EXIF (sem cópia se já estiver normal)."""
+    from PIL import ImageOps
+
+    if img.getexif().get(_EXIF_ORIENTATION, 1) == 1:
+        return img
+    return ImageOps.exif_transpose(img)
+
+def to_rgb(img):
+    if img.mode in _SIXTEEN_BIT_MODES:
+        # convert("RGB") satura os valores de 16 bits; aqui eles são reduzidos para 8
+        img = img.convert("I").point(lambda value: value * (1 / 256)).convert("L")
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return img
+
+def clamped_size(size, max_pixels=MAX_PAGE_PIXELS):
+    width, height = size
+    if not max_pixels or width * height <= max_pixels:
+        return size
+    scale = math.sqrt(max_pixels / (width * height))
+    return (max(1, int(width * scale)), max(1, int(height * scale)))
+
+def normalized_size(img, max_pixels=MAX_PAGE_PIXELS):
+    """Tamanho que a página terá depois de normalizada, sem decodificá-la."""
+    width, height = img.size
+    if img.getexif().get(_EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+        width, height = height, width
+    return clamped_size((width, height), max_pixels)
+
+def normalize(img, max_pixels=MAX_PAGE_PIXELS):
+    """Aplica a orientação EXIF, converte para RGB de 8 bits e limita a resolução."""
+    from PIL import Image
+
+    img = to_rgb(exif_transpose(img))
+    size = clamped_size(img.size, max_pixels)
+    if size != img.size:
+        img = img.resize(size, Image.LANCZOS, reducing_gap=3.0)
+    return img
+
+
+class PixelStore:
+    def __init__(self, root=PIXEL_DIR, max_bytes=PIXEL_CACHE_MB * 1024 * 1024, max_pixels=MAX_PAGE_PIXELS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self._lock = threading.Lock()
+        # Bytes no diretório na última varredura mais os gravados depois (None: ainda não varrido)
+        self._total = None
+        # A próxima varredura acontece quando _total passar disto
+        self._prune_at = max_bytes
+        self._pins = Counter()
+        os.makedirs(root, exist_ok=True)
+
+    @contextmanager
+    def pinned(self, sha256s):
+        """Protege as páginas `sha256s` da remoção enquanto o bloco durar (ex.: a geração de um livro)."""
+        pins = Counter(sha256s)
+        with self._lock:
+            self._pins += pins
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pins -= pins
+
+    def path(self, sha256):
+        return os.path.join(self.root, sha256[:2], f"{sha256}.rgbx")
+
+    def __contains__(self, sha256):
+        return os.path.exists(self.path(sha256))
+
+    def _map(self, path):
+        from PIL import Image
+
+        try:
+            with open(path, "rb") as fh:
+                mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        magic, width, height = _HEADER.unpack_from(mapped) if len(mapped) >= _HEADER.size else (None, 0, 0)
+        if magic != _MAGIC or len(mapped) != _HEADER.size + width * height * 4:
+            mapped.close()
+            return None
+        try:
+            # O mtime marca o último uso (ordem da remoção por tamanho)
+            os.utime(path)
+        except OSError:
+            pass
+        # A imagem mantém o mmap aberto enquanto existir, mesmo que o arquivo seja removido
+        return Image.frombuffer("RGBX", (width, height), memoryview(mapped)[_HEADER.size:], "raw", "RGBX", 0, 1)
+
+    def ingest(self, sha256, source, prune=True):
+        """Normaliza e grava a página, se ainda não estiver no disco.
+
+        `source` é o caminho ou os bytes da imagem original. Devolve a imagem normalizada
+        (RGBX, em memória), ou None se a página já estava armazenada. Com prune=False o
+        limite de tamanho fica para a próxima varredura (ex.: a do fim do lote).
+        """
+        from PIL import Image
+
+        path = self.path(sha256)
+        if os.path.exists(path):
+            return None
+        with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as original:
+            img = normalize(original, self.max_pixels).convert("RGBX")
+
+        size = _HEADER.size + img.width * img.height * 4
+        if size <= self.max_bytes:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".pixels-")
+            try:
+                with os.fdopen(fd, "wb") as fh:
+                    fh.write(_HEADER.pack(_MAGIC, img.width, img.height))
+                    fh.write(img.tobytes())
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            with self._lock:
+                if self._total is not None:
+                    self._total += size
+                due = self._total is None or self._total > self._prune_at
+            if prune and due:
+                self.prune()
+        return img
+
+    def open(self, sha256, source):
+        """A página normalizada (RGBX, somente leitura), mapeada do disco; normaliza na primeira vez."""
+        path = self.path(sha256)
+        img = self._map(path)
+        if img is not None:
+            return img
+        if os.path.exists(path):
+            # Arquivo truncado ou de outro formato: é refeito a partir do original
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        # Pode rodar num worker de renderização: quem varre é o processo principal, ao fim do lote
+        produced = self.ingest(sha256, source, prune=False)
+        # Depois de gravada, a página é lida pelo mmap e a cópia em memória é descartada
+        img = self._map(path)
+        if img is None:
+            img = produced
+        if img is None:
+            from PIL import Image
+
+            with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as original:
+                img = normalize(original, self.max_pixels).convert("RGBX")
+        return img
+
+    def prune(self):
+        """Se o diretório passar de max_bytes, remove as páginas usadas há mais tempo (e não protegidas)."""
+        with self._lock:
+            entries = []
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    if not name.endswith(".rgbx"):
+                        continue
+                    file_path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(file_path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, file_path))
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * PRUNE_TARGET if total > self.max_bytes else total
+            removed = 0
+            for _, size, file_path in sorted(entries):
+                if total <= target:
+                    break
+                if os.path.basename(file_path)[:-len(".rgbx")] in self._pins:
+                    continue
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    # No Windows, um arquivo mapeado não pode ser removido
+                    continue
+                total -= size
+                removed += 1
+            self._total = total
+            # Se as páginas protegidas não deixarem o diretório caber, a próxima varredura
+            # espera ele crescer tanto quanto uma remoção normal liberaria
+            self._prune_at = max(self.max_bytes, total + self.max_bytes * (1 - PRUNE_TARGET))
+            return removed
+
+
+_default_store = None
+_store_lock = threading.Lock()
+_ingest_executor = None
+
+def get_pixel_store():
+    """Armazenamento único por processo (o diretório pode ser compartilhado entre processos)."""
+    global _default_store
+    with _store_lock:
+        if _default_store is None:
+            _default_store = PixelStore()
+        return _default_store
+
+def ingest_in_background(sha256, source):
+    """Normaliza a página numa thread à parte, para que ela já esteja pronta ao gerar o livro."""
+    global _ingest_executor
+    with _store_lock:
+        if _ingest_executor is None:
+            _ingest_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="toth-ingest")
+    return _ingest_executor.submit(get_pixel_store().ingest, sha256, source)
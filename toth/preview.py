@@ -0,0 +1,119 @@
+"""Pré-visualização rápida da numeração e da logo, em escala reduzida.
+
+Usa o mesmo layout de add_page_number e add_logo_bottom_center sobre uma cópia
+reduzida da página, com fonte, margens e logo escaladas a partir das dimensões reais
+dela; o resultado é a página do livro vista de longe. A página reduzida fica em cache
+pelo conteúdo e cada prévia pronta pela mesma chave do cache de renderização (página
+mais os parâmetros que a afetam), então mudar um widget só redesenha o número.
+"""
+import io
+import threading
+from collections import OrderedDict
+
+from toth.assets import get_asset_registry
+
+PREVIEW_WIDTH = 400
+PREVIEW_QUALITY = 85
+# Páginas reduzidas decodificadas (cerca de 0,5 MB cada) e prévias prontas (cerca de 30 KB)
+BASE_CACHE_SIZE = 32
+PREVIEW_CACHE_SIZE = 512
+
+_bases = OrderedDict()
+_previews = OrderedDict()
+_lock = threading.Lock()
+
+
+def clear_preview_cache():
+    with _lock:
+        _previews.clear()
+
+# Logo ou fonte trocada no disco: as prévias prontas deixam de valer
+get_asset_registry().on_invalidate(clear_preview_cache)
+
+def _cache_get(cache, key):
+    with _lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+def _cache_put(cache, key, value, limit):
+    with _lock:
+        cache[key] = value
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+def _page_base(sha256, source, width):
+    """Página reduzida para `width` px de largura (RGB) e o tamanho real dela."""
+    from PIL import Image
+
+    from toth.pixels import exif_transpose, normalized_size, to_rgb
+
+    key = (sha256, width)
+    base = _cache_get(_bases, key)
+    if base is not None:
+        return base
+
+    img = Image.open(source if isinstance(source, str) else io.BytesIO(source))
+    # Tamanho da página como a renderização a verá (orientação EXIF e limite de resolução)
+    real_size = normalized_size(img)
+    height = max(1, round(real_size[1] * width / real_size[0]))
+    # Em JPEGs o draft faz o decodificador reduzir a imagem já na leitura
+    img.draft("RGB", (width, width))
+    img = to_rgb(exif_transpose(img))
+    img = img.resize((width, height), Image.BILINEAR, reducing_gap=2.0)
+    base = (img, real_size)
+    _cache_put(_bases, key, base, BASE_CACHE_SIZE)
+    return base
+
+def render_preview(job, width=PREVIEW_WIDTH, vector=False):
+    """JPEG reduzido da página descrita por `job` (de build_page_jobs), com numeração e logo.
+
+    Com `vector`, o número segue a geometria do texto do PDF (_number_operators):
+    fonte, margem e contorno proporcionais à altura real da página, e não fixos para
+    uma página de NUMBER_REFERENCE_HEIGHT px.
+    """
+    from toth.imaging import LOGO_PATH, NUMBER_REFERENCE_HEIGHT, add_logo_bottom_center, add_page_number
+    from toth.render import page_cache_key
+
+    key = (page_cache_key(job), width, vector)
+    preview = _cache_get(_previews, key)
+    if preview is not None:
+        return preview
+
+    img, (real_width, real_height) = _page_base(job["sha256"], job["source"], width)
+    scale = img.width / real_width
+    if job["display_number"] is not None:
+        number_scale = scale * real_height / NUMBER_REFERENCE_HEIGHT if vector else scale
+        img = add_page_number(img, job["display_number"], job["alignment"],
+                              style=job["number_style"], custom_color=job["custom_color"], scale=number_scale)
+    if job["include_logo"]:
+        img = add_logo_bottom_center(img, logo_path=LOGO_PATH, margin_bottom_cm=1.0, max_logo_width=200, scale=scale)
+
+    with io.BytesIO() as output:
+        img.save(output, format="JPEG", quality=PREVIEW_QUALITY)
+        preview = output.getvalue()
+    _cache_put(_previews, key, preview, PREVIEW_CACHE_SIZE)
+    return preview
+
+def render_previews(files, positions, config, width=PREVIEW_WIDTH):
+    """Prévias das páginas nas `positions` (1 é a capa), com a configuração do livro.
+
+    A numeração sempre aparece desenhada; no modo vetorial ela usa o tamanho e a
+    posição do texto do PDF, com a mesma fonte.
+    """
+    from toth.pipeline import DEFAULT_NUMBER_MODE
+    from toth.render import build_page_jobs
+
+    jobs = build_page_jobs(
+        files,
+        config["num_start"],
+        config["num_end"],
+        config["initial_number"],
+        config["alignment"],
+        config["number_style"],
+        custom_color=config["custom_color"],
+        include_logo=config["include_logo"]
+    )
+    vector = config.get("number_mode", DEFAULT_NUMBER_MODE) == "vector"
+    return [render_preview(jobs[position - 1], width, vector) for position in positions]
@@ -0,0 +1,26 @@
+"""Formatos de impressão do PDF com sangria.
+
+Cada formato define o tamanho do corte (trim) em polegadas. A página final soma a
+sangria na borda externa e em cima e embaixo, como pedem as gráficas por demanda:
+6 x 9 pol. com 0,125 pol. de sangria vira 6,125 x 9,25 pol.
+"""
+PRINT_PROFILES = {
+    "6x9": {"label": "6 x 9 pol. (padrão)", "trim_width_in": 6.0, "trim_height_in": 9.0},
+    "5.5x8.5": {"label": "5,5 x 8,5 pol.", "trim_width_in": 5.5, "trim_height_in": 8.5},
+    "8.5x8.5": {"label": "8,5 x 8,5 pol. (quadrado)", "trim_width_in": 8.5, "trim_height_in": 8.5},
+    "8.5x11": {"label": "8,5 x 11 pol. (carta)", "trim_width_in": 8.5, "trim_height_in": 11.0},
+    "A5": {"label": "A5 (148 x 210 mm)", "trim_width_in": 148 / 25.4, "trim_height_in": 210 / 25.4},
+    "A4": {"label": "A4 (210 x 297 mm)", "trim_width_in": 210 / 25.4, "trim_height_in": 297 / 25.4},
+}
+DEFAULT_PRINT_PROFILE = "6x9"
+PRINT_DPIS = (150, 300, 600)
+DEFAULT_PRINT_DPI = 300
+BLEED_IN = 0.125
+
+
+def bleed_page_size(profile=DEFAULT_PRINT_PROFILE, dpi=DEFAULT_PRINT_DPI):
+    """Tamanho em pixels da página com sangria para o formato e a resolução pedidos."""
+    settings = PRINT_PROFILES[profile]
+    width_inch = settings["trim_width_in"] + BLEED_IN
+    height_inch = settings["trim_height_in"] + 2 * BLEED_IN
+    return int(round(width_inch * dpi)), int(round(height_inch * dpi))
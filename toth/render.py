@@ -0,0 +1,276 @@
+"""Motor de renderização das páginas do livro.
+
+Cada página é processada de forma independente (decodificação, numeração, logo e
+recodificação em JPEG), então o trabalho pode ser distribuído entre processos ou
+threads. O resultado é sempre devolvido na ordem das páginas, e o JPEG é idêntico,
+byte a byte, ao da execução serial.
+
+As páginas renderizadas ficam num cache endereçado pelo conteúdo: a chave é o hash
+da imagem original mais os parâmetros que de fato alteram aquela página. Assim,
+renomear o livro, mover uma página ou mudar o fim da numeração só renderiza de novo
+as páginas afetadas.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from toth.assets import get_asset_registry
+from toth.imaging import LOGO_PATH, add_logo_bottom_center, add_page_number, asset_version
+from toth.pdf import can_embed_jpeg
+from toth.pixels import get_pixel_store, is_rotated
+from toth.store import read_source
+
+# "process", "thread" ou "serial"; o número de workers 0 usa todos os núcleos
+RENDER_BACKEND = os.getenv("TOTH_RENDER_BACKEND", "process")
+RENDER_WORKERS = int(os.getenv("TOTH_RENDER_WORKERS", "0"))
+# Memória máxima ocupada pelas páginas em cache (JPEG + imagem decodificada, se houver), em MB
+RENDER_CACHE_MB = int(os.getenv("TOTH_RENDER_CACHE_MB", "512"))
+
+# Os workers saem de um processo servidor próprio (forkserver), e não de um fork do
+# servidor do Streamlit: o fork copiaria travas (registro de arquivos, pixels, logging)
+# que outras threads podem estar segurando, e o worker travaria nelas. O servidor já
+# importa este módulo uma vez, então cada worker nasce com o Pillow e o toth prontos.
+# Sem forkserver (Windows), os processos são criados do zero (spawn).
+if "forkserver" in multiprocessing.get_all_start_methods():
+    PROCESS_CONTEXT = multiprocessing.get_context("forkserver")
+    PROCESS_CONTEXT.set_forkserver_preload(["toth.render"])
+else:
+    PROCESS_CONTEXT = multiprocessing.get_context("spawn")
+
+
+class RenderCache:
+    """Cache LRU das páginas renderizadas, limitado em bytes e compartilhado entre sessões."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _entry_size(entry):
+        img = entry["image"]
+        if img is None:
+            return len(entry["data"])
+        return img.width * img.height * len(img.getbands()) + len(entry["data"])
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        size = self._entry_size(entry)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= self._entry_size(old)
+            self._entries[key] = entry
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= self._entry_size(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+PAGE_CACHE = RenderCache(RENDER_CACHE_MB * 1024 * 1024)
+# Logo ou fonte trocada no disco: as páginas antigas só ocupariam memória
+get_asset_registry().on_invalidate(PAGE_CACHE.clear)
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def build_page_jobs(files, num_start, num_end, initial_number, alignment, number_style,
+                    custom_color=None, include_logo=True, burn_numbers=True):
+    """Monta a descrição de cada página (na ordem final) com apenas o que ela precisa para ser renderizada.
+
+    Com burn_numbers=False a numeração não é desenhada nos pixels (fica a cargo do PDF vetorial).
+    """
+    jobs = []
+    total = len(files)
+    for pos, f_dict in enumerate(files, start=1):
+        if burn_numbers and num_start <= pos <= num_end:
+            display_number = initial_number + (pos - num_start)
+        else:
+            display_number = None
+        # A página pode vir do spool de uploads (caminho) ou já carregada em memória
+        source = f_dict.get("path") or f_dict["original_data"]
+        jobs.append({
+            "position": pos,
+            "source": source,
+            "sha256": f_dict.get("sha256") or content_hash(read_source(source)),
+            "display_number": display_number,
+            "alignment": alignment,
+            "number_style": number_style,
+            "custom_color": custom_color,
+            "include_logo": include_logo and (pos == 1 or pos == total),
+        })
+    return jobs
+
+def page_cache_key(job):
+    # Estilo, cor e alinhamento só importam para páginas numeradas
+    if job["display_number"] is None:
+        numbering = None
+    else:
+        numbering = (job["display_number"], job["number_style"], job["custom_color"], job["alignment"])
+    # A fonte e a logo entram pelo conteúdo: trocá-las no disco não devolve páginas antigas
+    assets = asset_version(job["number_style"] if numbering else None, job["include_logo"])
+    return (job["sha256"], numbering, job["include_logo"], assets)
+
+def render_page(job):
+    """Renderiza uma página; `timings` traz os segundos gastos em cada passo (para o trace)."""
+    timings = {}
+    start = time.perf_counter()
+
+    def lap(step):
+        nonlocal start
+        now = time.perf_counter()
+        timings[step] = now - start
+        start = now
+
+    # Sempre utiliza os dados originais para não acumular numerações
+    original_data = read_source(job["source"])
+    lap("read")
+
+    if (job["display_number"] is None and not job["include_logo"] and can_embed_jpeg(original_data)
+            and not is_rotated(original_data)):
+        # Página não modificada e já em JPEG: reaproveita os bytes originais, sem decodificar
+        # nem recomprimir; quem precisar dos pixels (PDF com sangria) decodifica na escala que usar
+        return {"position": job["position"], "image": None, "data": bytes(original_data),
+                "bytes_in": len(original_data), "timings": timings}
+
+    # Página normalizada (orientação, modo de cor, resolução) mapeada do disco, sem decodificar;
+    # na primeira vez que o conteúdo aparece ela é decodificada e gravada (toth.pixels)
+    img = get_pixel_store().open(job["sha256"], original_data)
+    lap("decode")
+
+    if job["display_number"] is not None:
+        img = add_page_number(img, job["display_number"], job["alignment"],
+                              style=job["number_style"], custom_color=job["custom_color"])
+        lap("numbering")
+
+    if job["include_logo"]:
+        img = add_logo_bottom_center(img, logo_path=LOGO_PATH, margin_bottom_cm=1.0, max_logo_width=200)
+        lap("logo")
+
+    with io.BytesIO() as output:
+        img.save(output, format="JPEG")
+        data = output.getvalue()
+    lap("encode")
+
+    return {"position": job["position"], "image": img, "data": data,
+            "bytes_in": len(original_data), "timings": timings}
+
+
+
+def _render_page_data(job):
+    # Nos processos só o JPEG volta ao processo principal: serializar também a imagem
+    # decodificada custaria o bitmap inteiro por página. Quem precisa dos pixels (PDF com
+    # sangria) decodifica o JPEG, como já faz com as páginas não modificadas
+    page = render_page(job)
+    page["image"] = None
+    return page
+
+def _resolve_workers(workers, n_jobs):
+    if workers is None:
+        workers = RENDER_WORKERS
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return max(1, min(workers, n_jobs))
+
+def _render_all(jobs, workers, backend, on_page):
+    if not jobs:
+        return []
+
+    workers = _resolve_workers(workers, len(jobs))
+    if backend == "serial" or workers == 1:
+        results = []
+        for job in jobs:
+            results.append(render_page(job))
+            on_page()
+        return results
+
+    if backend == "process":
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=PROCESS_CONTEXT)
+        # Agrupa páginas por tarefa para diluir o custo de serialização entre processos
+        chunksize = max(1, len(jobs) // (workers * 4))
+        render = _render_page_data
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+        chunksize = 1
+        render = render_page
+    results = []
+    try:
+        # map preserva a ordem de entrada independentemente da ordem de conclusão
+        for page in executor.map(render, jobs, chunksize=chunksize):
+            results.append(page)
+            on_page()
+    except BaseException:
+        # Erro ou cancelamento (exceção levantada pelo callback de progresso): descarta o que falta
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    return results
+
+def render_pages(jobs, workers=None, backend=None, cache=PAGE_CACHE, progress=None):
+    """Renderiza todas as páginas e devolve os resultados na mesma ordem de `jobs`.
+
+    Páginas presentes em `cache` são reaproveitadas; apenas as demais vão para o pool.
+    Passe `cache=None` para renderizar tudo de novo. `progress(feitas, total)` é chamado
+    a cada página concluída e pode levantar uma exceção para interromper a renderização.
+    """
+    backend = backend or RENDER_BACKEND
+    if backend not in ("process", "thread", "serial"):
+        raise ValueError(f"Backend de renderização desconhecido: {backend}")
+
+    results = [None] * len(jobs)
+    pending = []
+    for i, job in enumerate(jobs):
+        entry = cache.get(page_cache_key(job)) if cache is not None else None
+        if entry is None:
+            pending.append(i)
+        else:
+            results[i] = {"position": job["position"], "image": entry["image"], "data": entry["data"]}
+
+    done = len(jobs) - len(pending)
+    total = len(jobs)
+
+    def on_page():
+        nonlocal done
+        done += 1
+        if progress is not None:
+            progress(done, total)
+
+    if progress is not None:
+        progress(done, total)
+    rendered = _render_all([jobs[i] for i in pending], workers, backend, on_page)
+    if pending:
+        # Os workers gravam as páginas normalizadas sem varrer o diretório; o limite é aplicado aqui, uma vez por lote
+        get_pixel_store().prune()
+    for i, page in zip(pending, rendered):
+        if cache is not None:
+            cache.put(page_cache_key(jobs[i]), {"image": page["image"], "data": page["data"]})
+        results[i] = page
+    return results
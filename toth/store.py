@@ -0,0 +1,97 @@
+"""Armazenamento das imagens enviadas, endereçado pelo SHA-256 do conteúdo.
+
+Cada imagem é gravada uma única vez num diretório de spool e nunca mais alterada;
+a sessão guarda apenas o hash e o caminho do arquivo. Uploads idênticos, mesmo de
+sessões diferentes, compartilham a mesma cópia.
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+UPLOAD_DIR = os.getenv("TOTH_UPLOAD_DIR") or os.path.join(tempfile.gettempdir(), "toth_uploads")
+# Arquivos sem uso há mais tempo que isso são removidos do spool
+UPLOAD_TTL_HOURS = float(os.getenv("TOTH_UPLOAD_TTL_HOURS", "72"))
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def read_source(source):
+    """Devolve os bytes de uma página, seja ela um caminho no disco ou os próprios bytes."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return source
+    with open(source, "rb") as fh:
+        return fh.read()
+
+
+class UploadStore:
+    def __init__(self, root=UPLOAD_DIR):
+        self.root = root
+        self._last_prune = 0.0
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def __contains__(self, sha256):
+        return os.path.exists(self.path(sha256))
+
+    def put(self, fileobj):
+        """Copia o conteúdo de `fileobj` para o spool em blocos e devolve (sha256, caminho)."""
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                while True:
+                    chunk = fileobj.read(_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            sha256 = digest.hexdigest()
+            final_path = self.path(sha256)
+            if os.path.exists(final_path):
+                # Conteúdo já armazenado: mantém a cópia existente e renova seu prazo
+                os.utime(final_path)
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.chmod(tmp_path, 0o444)
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return sha256, final_path
+
+    def open(self, sha256):
+        return open(self.path(sha256), "rb")
+
+    def prune(self, max_age_hours=UPLOAD_TTL_HOURS, min_interval=3600):
+        """Remove arquivos não enviados novamente há mais de `max_age_hours` (no máximo uma vez por `min_interval` s)."""
+        now = time.time()
+        if now - self._last_prune < min_interval:
+            return 0
+        self._last_prune = now
+        removed = 0
+        cutoff = now - max_age_hours * 3600
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                file_path = os.path.join(dirpath, name)
+                try:
+                    if os.path.getmtime(file_path) < cutoff:
+                        os.remove(file_path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+
+_default_store = None
+
+def get_upload_store():
+    """Spool compartilhado pelo processo (o script do Streamlit é reexecutado a cada interação)."""
+    global _default_store
+    if _default_store is None:
+        _default_store = UploadStore()
+    return _default_store
@@ -0,0 +1,45 @@
+"""Miniaturas das páginas exibidas na grade de reordenação."""
+import io
+import threading
+from collections import OrderedDict
+
+THUMB_SIZE = 256
+THUMB_QUALITY = 80
+# Quantidade de miniaturas mantidas em memória (cerca de 15 KB cada)
+THUMB_CACHE_SIZE = 4096
+
+_thumb_cache = OrderedDict()
+_thumb_lock = threading.Lock()
+
+
+def make_thumbnail(source, size=THUMB_SIZE):
+    # Pillow só é carregado quando a primeira miniatura é gerada
+    from PIL import Image
+
+    # Aceita um caminho no disco ou os bytes da imagem
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    img = Image.open(source)
+    # Em JPEGs o draft faz o decodificador reduzir a imagem (1/2, 1/4 ou 1/8) já na leitura
+    img.draft("RGB", (size, size))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail((size, size), Image.BILINEAR, reducing_gap=2.0)
+    with io.BytesIO() as output:
+        img.save(output, format="JPEG", quality=THUMB_QUALITY)
+        return output.getvalue()
+
+def get_thumbnail(sha256, source):
+    """Devolve a miniatura da página, gerando-a só na primeira vez que o conteúdo aparece."""
+    with _thumb_lock:
+        thumb = _thumb_cache.get(sha256)
+        if thumb is not None:
+            _thumb_cache.move_to_end(sha256)
+            return thumb
+
+    thumb = make_thumbnail(source)
+    with _thumb_lock:
+        _thumb_cache[sha256] = thumb
+        while len(_thumb_cache) > THUMB_CACHE_SIZE:
+            _thumb_cache.popitem(last=False)
+    return thumb
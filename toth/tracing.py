@@ -0,0 +1,271 @@
+"""Medição por etapa da geração do livro e do envio ao Drive.
+
+Cada execução (uma geração, um envio) tem um Trace; cada etapa dentro dela é
+medida com `trace.span(nome)`: duração, bytes de entrada e de saída e pico de RSS
+do processo enquanto a etapa estava ativa. Spans com o mesmo nome são acumulados
+(ex.: o redimensionamento de cada página do PDF com sangria).
+
+Ao terminar, o trace é registrado de três formas: o resumo devolvido por
+Trace.summary() (exibido no painel de diagnóstico do app), uma linha de log JSON
+no logger "toth.trace" e, se TOTH_PROMETHEUS_FILE estiver definido, métricas
+acumuladas no formato texto do Prometheus (para o textfile collector do node
+exporter).
+"""
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRACE_LOG = os.getenv("TOTH_TRACE_LOG", "1") != "0"
+PROMETHEUS_FILE = os.getenv("TOTH_PROMETHEUS_FILE")
+# Intervalo de amostragem da memória enquanto há etapas em andamento
+RSS_SAMPLE_SECONDS = 0.05
+
+logger = logging.getLogger("toth.trace")
+if TRACE_LOG and not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def current_rss():
+    """RSS atual do processo em bytes (no Windows/macOS, o pico do processo)."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageStats:
+    """Totais acumulados de uma etapa."""
+
+    __slots__ = ("stage", "calls", "duration_s", "bytes_in", "bytes_out", "peak_rss")
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.calls = 0
+        self.duration_s = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.peak_rss = None
+
+    def observe_rss(self, rss):
+        if rss is not None and (self.peak_rss is None or rss > self.peak_rss):
+            self.peak_rss = rss
+
+    def as_dict(self):
+        return {
+            "stage": self.stage,
+            "calls": self.calls,
+            "duration_s": round(self.duration_s, 4),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "peak_rss_mb": None if self.peak_rss is None else round(self.peak_rss / (1024 * 1024), 1),
+        }
+
+
+class _RssSampler:
+    """Thread que amostra o RSS enquanto houver alguma etapa ativa (de qualquer trace)."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def enter(self, stats):
+        with self._lock:
+            self._active[id(stats)] = (stats, self._active.get(id(stats), (stats, 0))[1] + 1)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="toth-rss-sampler", daemon=True)
+                self._thread.start()
+
+    def exit(self, stats):
+        with self._lock:
+            _, depth = self._active.pop(id(stats), (stats, 1))
+            if depth > 1:
+                self._active[id(stats)] = (stats, depth - 1)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                targets = [stats for stats, _ in self._active.values()]
+            rss = current_rss()
+            for stats in targets:
+                stats.observe_rss(rss)
+            time.sleep(self.interval)
+
+
+_sampler = _RssSampler(RSS_SAMPLE_SECONDS)
+
+
+class Trace:
+    """Medições de uma execução (`name` é o tipo: "generation", "upload")."""
+
+    def __init__(self, name, **labels):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.labels = labels
+        self.started_at = time.time()
+        self.duration_s = None
+        self.status = None
+        self._stages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def stats(self, stage):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = StageStats(stage)
+            return stats
+
+    @contextmanager
+    def span(self, stage, bytes_in=0):
+        """Mede um trecho; o StageStats devolvido aceita `bytes_out += n` dentro do bloco."""
+        stats = self.stats(stage)
+        stats.bytes_in += bytes_in
+        stats.observe_rss(current_rss())
+        _sampler.enter(stats)
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.duration_s += time.perf_counter() - start
+            stats.calls += 1
+            _sampler.exit(stats)
+            stats.observe_rss(current_rss())
+
+    def add(self, stage, duration_s, bytes_in=0, bytes_out=0, calls=1):
+        """Registra uma medição feita fora deste processo (ex.: nos workers de renderização)."""
+        stats = self.stats(stage)
+        with self._lock:
+            stats.duration_s += duration_s
+            stats.bytes_in += bytes_in
+            stats.bytes_out += bytes_out
+            stats.calls += calls
+
+    def summary(self):
+        with self._lock:
+            stages = [stats.as_dict() for stats in self._stages.values()]
+        return {
+            "id": self.id,
+            "name": self.name,
+            "labels": self.labels,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_s": None if self.duration_s is None else round(self.duration_s, 4),
+            "stages": stages,
+        }
+
+    def finish(self, status="ok"):
+        """Fecha o trace e publica o resumo no log e no arquivo do Prometheus."""
+        self.status = status
+        self.duration_s = time.time() - self.started_at
+        summary = self.summary()
+        if TRACE_LOG:
+            logger.info(json.dumps({"event": "trace", **summary}, ensure_ascii=False))
+        if PROMETHEUS_FILE:
+            _metrics.record(summary)
+            try:
+                _metrics.write(PROMETHEUS_FILE)
+            except OSError as exc:
+                logger.warning(json.dumps({"event": "prometheus_write_failed", "error": str(exc)}))
+        return summary
+
+
+class NullTrace:
+    """Trace que não mede nada, para chamadas fora da geração do app."""
+
+    @contextmanager
+    def span(self, stage, bytes_in=0):
+        yield StageStats(stage)
+
+    def add(self, stage, duration_s, bytes_in=0, bytes_out=0, calls=1):
+        pass
+
+
+NULL_TRACE = NullTrace()
+
+
+class _Metrics:
+    """Totais do processo desde o início, no formato texto do Prometheus."""
+
+    _COUNTERS = (
+        ("toth_stage_seconds_total", "duration_s", "Tempo gasto na etapa"),
+        ("toth_stage_calls_total", "calls", "Execuções da etapa"),
+        ("toth_stage_bytes_in_total", "bytes_in", "Bytes lidos pela etapa"),
+        ("toth_stage_bytes_out_total", "bytes_out", "Bytes produzidos pela etapa"),
+    )
+
+    def __init__(self):
+        self._stages = {}
+        self._peaks = {}
+        self._traces = {}
+        self._lock = threading.Lock()
+
+    def record(self, summary):
+        with self._lock:
+            key = (summary["name"], summary["status"])
+            self._traces[key] = self._traces.get(key, 0) + 1
+            for stage in summary["stages"]:
+                labels = (summary["name"], stage["stage"])
+                totals = self._stages.setdefault(labels, {field: 0 for _, field, _ in self._COUNTERS})
+                for _, field, _ in self._COUNTERS:
+                    totals[field] += stage[field]
+                if stage["peak_rss_mb"] is not None:
+                    self._peaks[labels] = stage["peak_rss_mb"] * 1024 * 1024
+
+    def render(self):
+        with self._lock:
+            lines = ["# HELP toth_traces_total Execuções finalizadas por tipo e status",
+                     "# TYPE toth_traces_total counter"]
+            for (name, status), count in sorted(self._traces.items()):
+                lines.append(f'toth_traces_total{{trace="{name}",status="{status}"}} {count}')
+            for metric, field, help_text in self._COUNTERS:
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+                for (name, stage), totals in sorted(self._stages.items()):
+                    lines.append(f'{metric}{{trace="{name}",stage="{stage}"}} {totals[field]}')
+            lines += ["# HELP toth_stage_peak_rss_bytes Pico de RSS na última execução da etapa",
+                      "# TYPE toth_stage_peak_rss_bytes gauge"]
+            for (name, stage), peak in sorted(self._peaks.items()):
+                lines.append(f'toth_stage_peak_rss_bytes{{trace="{name}",stage="{stage}"}} {peak:.0f}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # Escrita atômica: o collector nunca lê um arquivo pela metade
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".toth-metrics-")
+        try:
+            with os.fdopen(fd, "w") as fh:
+                fh.write(self.render())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+_metrics = _Metrics()